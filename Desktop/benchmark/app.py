@@ -1,19 +1,17 @@
 import streamlit as st
 import json
 import os
-import pickle
 import cv2
 import numpy as np
 from PIL import Image
-from sklearn.metrics.pairwise import cosine_similarity
 from insightface.app import FaceAnalysis
+from matcher import FaceMatcher
 
 # ------------------- Load Data -------------------
 with open("person_to_photos.json", "r") as f:
     person_to_photos = json.load(f)
 
-with open("cluster_representatives.pkl", "rb") as f:
-    cluster_embeddings = pickle.load(f)
+matcher = FaceMatcher.from_pickle("cluster_representatives.pkl")
 
 st.set_page_config(page_title="Face Gallery", layout="wide")
 st.title("🧠 AI-Powered Face Photo Gallery")
@@ -67,15 +65,8 @@ if uploaded_file:
         else:
             uploaded_embedding = faces[0].embedding
 
-            # Compute similarity to each cluster representative
-            similarities = {
-                str(pid): cosine_similarity([uploaded_embedding], [emb])[0][0]
-                for pid, emb in cluster_embeddings.items()
-            }
-
-            # Sort and pick best match
-            best_match_id = max(similarities, key=similarities.get)
-            best_score = similarities[best_match_id]
+            # Score all cluster representatives at once and pick best match
+            best_match_id, best_score = matcher.best(uploaded_embedding)
 
             st.success(f"✅ This face matches **Person {best_match_id}** with similarity `{best_score:.4f}`")
 
@@ -2,20 +2,18 @@ from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import uvicorn
-import pickle
 import json
 import os
 import numpy as np
 import cv2
 from insightface.app import FaceAnalysis
-from sklearn.metrics.pairwise import cosine_similarity
+from matcher import FaceMatcher
 
 # Load model and cluster data once on startup
 face_app = FaceAnalysis(name="buffalo_l")
 face_app.prepare(ctx_id=0)
 
-with open("cluster_representatives.pkl", "rb") as f:
-    cluster_embeddings = pickle.load(f)
+matcher = FaceMatcher.from_pickle("cluster_representatives.pkl")
 
 with open("person_to_photos.json", "r") as f:
     person_to_photos = json.load(f)
@@ -56,13 +54,8 @@ async def get_similar_photos(request: MatchRequest):  #parses the request body i
 
     uploaded_embedding = faces[0].embedding
 
-    # Compute similarity with each cluster representative
-    similarities = {
-        str(pid): cosine_similarity([uploaded_embedding], [emb])[0][0]
-        for pid, emb in cluster_embeddings.items()
-    }
-
-    best_match_id = max(similarities, key=similarities.get)
+    # Compute similarity with every cluster representative in one matrix product
+    best_match_id, best_score = matcher.best(uploaded_embedding)
     image_paths = person_to_photos.get(best_match_id, [])
 
     return {
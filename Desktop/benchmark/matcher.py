@@ -0,0 +1,59 @@
+import pickle
+import numpy as np
+
+
+def normalize_rows(matrix):
+    # L2-normalise each row; zero rows stay zero (same as sklearn's cosine_similarity)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class FaceMatcher:
+    """Cosine-similarity search over one embedding per person (cluster).
+
+    The representatives are stacked once into a contiguous, L2-normalised
+    float32 matrix, so scoring a query is a single matrix-vector product
+    instead of one cosine_similarity call per cluster.
+    """
+
+    def __init__(self, ids, embeddings):
+        self.ids = [str(pid) for pid in ids]
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        self.matrix = np.ascontiguousarray(normalize_rows(matrix))
+
+    @classmethod
+    def from_pickle(cls, path):
+        # cluster_representatives.pkl: {cluster_label: embedding}
+        with open(path, "rb") as f:
+            cluster_embeddings = pickle.load(f)
+        return cls(list(cluster_embeddings.keys()), list(cluster_embeddings.values()))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query):
+        # query: (dim,) or (n_queries, dim) -> cosine similarity per cluster
+        q = normalize_rows(np.asarray(query, dtype=np.float32))
+        return q @ self.matrix.T
+
+    def top_k(self, query, k=1):
+        """Return the k best (face_id, score) pairs for one query, best first."""
+        sims = self.scores(query)
+        return self._select(sims, k)
+
+    def best(self, query):
+        return self.top_k(query, 1)[0]
+
+    def _select(self, sims, k):
+        n = sims.shape[0]
+        k = min(k, n)
+        if k <= 0:
+            return []
+        if k < n:
+            # Partial selection: O(n) to find the k best, then sort only those
+            idx = np.argpartition(-sims, k - 1)[:k]
+        else:
+            idx = np.arange(n)
+        idx = idx[np.argsort(-sims[idx], kind="stable")]
+        return [(self.ids[i], float(sims[i])) for i in idx]
@@ -0,0 +1,79 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; retry_after is in seconds."""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Bounded admission in front of inference.
+
+    At most `limit` requests run at once. Up to `max_queue` more wait for a
+    slot, each for at most max_wait_ms (0 = no limit); anyone beyond that is
+    turned away immediately. Rejections raise Overloaded with a Retry-After
+    estimate from the recent time a request holds its slot. Only touched from
+    the event loop.
+    """
+
+    def __init__(self, limit, max_queue=64, max_wait_ms=5000.0):
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000.0 if max_wait_ms else None
+        self._slots = asyncio.Semaphore(self.limit)
+        self.active = 0
+        self.waiting = 0
+        self.service_s = 0.5  # moving average of slot hold time
+
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    def retry_after(self):
+        # Time for the queue ahead to drain at the current service rate
+        return max(1, math.ceil((self.waiting + 1) * self.service_s / self.limit))
+
+    @asynccontextmanager
+    async def admit(self):
+        if not self._slots.locked():
+            await self._slots.acquire()  # free slot: returns without suspending
+        elif self.waiting >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("Server is busy, please retry shortly.", "queue_full", self.retry_after())
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected["queue_timeout"] += 1
+                raise Overloaded("Server is busy, please retry shortly.", "queue_timeout", self.retry_after())
+            finally:
+                self.waiting -= 1
+
+        self.admitted += 1
+        self.active += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            self.service_s = 0.9 * self.service_s + 0.1 * (time.perf_counter() - start)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "max_wait_ms": self.max_wait * 1000.0 if self.max_wait else 0,
+            "mean_service_ms": round(self.service_s * 1000.0, 1),
+        }
@@ -0,0 +1,108 @@
+import csv
+import time
+import argparse
+import numpy as np
+from matcher import normalize_rows, top_k
+from index_bundle import BUNDLE_DIR, load_face_embeddings
+from ann_index import IVFIndex, HNSWIndex, hnswlib
+
+# ---------- SETUP ----------
+# Recall and latency of the ANN index against exact (brute-force) cosine
+# search over the same face embeddings, for queries from make_queries.
+output_csv = "ann_benchmark_log.csv"
+
+
+def load_embeddings(source):
+    # "bundle" is the default bundle directory
+    return np.asarray(load_face_embeddings(BUNDLE_DIR if source == "bundle" else source))
+
+
+def synthetic_embeddings(n, dim=512, faces_per_person=20, spread=0.6, seed=0):
+    # Clustered points on the sphere, roughly like ArcFace embeddings of an event
+    rng = np.random.default_rng(seed)
+    people = normalize_rows(rng.standard_normal((max(1, n // faces_per_person), dim)).astype(np.float32))
+    owner = rng.integers(0, people.shape[0], n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+    return normalize_rows(people[owner] + noise)
+
+
+def make_queries(x, n_queries, noise, seed=1):
+    # Stored faces plus noise, standing in for new selfies of people who are
+    # in the event
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(x.shape[0], min(n_queries, x.shape[0]), replace=False)
+    jitter = rng.standard_normal((len(picks), x.shape[1])).astype(np.float32) * (noise / np.sqrt(x.shape[1]))
+    return normalize_rows(x[picks] + jitter)
+
+
+def exact_search(x, queries, k):
+    start = time.perf_counter()
+    truth = [top_k(x @ q, k) for q in queries]
+    return truth, (time.perf_counter() - start) * 1000.0 / len(queries)
+
+
+def evaluate(index, queries, truth, k):
+    """recall@k, share of queries whose exact nearest face was found, ms/query."""
+    start = time.perf_counter()
+    hits = [set(index.search(q, k)[0].tolist()) for q in queries]
+    ms_per_query = (time.perf_counter() - start) * 1000.0 / len(queries)
+    recall = np.mean([len(hit & set(t.tolist())) / len(t) for t, hit in zip(truth, hits)])
+    top1 = np.mean([int(t[0]) in hit for t, hit in zip(truth, hits)])
+    return float(recall), float(top1), ms_per_query
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANN recall vs. brute force")
+    parser.add_argument("--source", default="bundle",
+                        help=f"'bundle' ({BUNDLE_DIR}/), a processed_data.pkl path, or 'synthetic'")
+    parser.add_argument("--synthetic-size", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.5, help="Query noise (relative norm)")
+    parser.add_argument("--k", type=int, default=50, help="Neighbours per query (ANN_SEARCH_K)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--ef", type=int, nargs="+", default=[50, 64, 100, 200, 400])
+    args = parser.parse_args()
+
+    if args.source == "synthetic":
+        x = synthetic_embeddings(args.synthetic_size)
+    else:
+        x = np.ascontiguousarray(normalize_rows(load_embeddings(args.source).astype(np.float32)))
+    queries = make_queries(x, args.queries, args.noise)
+    print(f"🚀 {x.shape[0]} faces x {x.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    truth, exact_ms = exact_search(x, queries, args.k)
+    rows = [{"index": "exact", "param": "", "recall": 1.0, "top1_found": 1.0,
+             "ms_per_query": round(exact_ms, 3), "build_s": 0.0}]
+    print(f"   exact              recall@{args.k} 1.000  top-1 found 1.000  {exact_ms:8.3f} ms/query")
+
+    start = time.time()
+    ivf = IVFIndex.build(x)
+    build_s = time.time() - start
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        recall, top1, ms = evaluate(ivf, queries, truth, args.k)
+        rows.append({"index": f"ivf nlist={ivf.params['nlist']}", "param": f"nprobe={nprobe}",
+                     "recall": round(recall, 4), "top1_found": round(top1, 4),
+                     "ms_per_query": round(ms, 3), "build_s": round(build_s, 2)})
+        print(f"   ivf nprobe={nprobe:<6} recall@{args.k} {recall:.3f}  top-1 found {top1:.3f}  {ms:8.3f} ms/query")
+
+    if hnswlib is not None:
+        start = time.time()
+        hnsw = HNSWIndex.build(x)
+        build_s = time.time() - start
+        for ef in args.ef:
+            hnsw.ef = ef
+            recall, top1, ms = evaluate(hnsw, queries, truth, args.k)
+            rows.append({"index": "hnsw M=32", "param": f"ef={ef}", "recall": round(recall, 4),
+                         "top1_found": round(top1, 4), "ms_per_query": round(ms, 3), "build_s": round(build_s, 2)})
+            print(f"   hnsw ef={ef:<9} recall@{args.k} {recall:.3f}  top-1 found {top1:.3f}  {ms:8.3f} ms/query")
+    else:
+        print("   (hnswlib not installed; HNSW skipped)")
+
+    # ---------- SAVE RESULTS ----------
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["index", "param", "recall", "top1_found", "ms_per_query", "build_s"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n✅ Done! 📁 Results saved to: {output_csv}")
@@ -0,0 +1,303 @@
+# Approximate nearest-neighbour index over every stored face embedding.
+#
+# ann_index/ (next to index_bundle/; built by cluster_faces.py, or by
+# `python ann_index.py` from processed_data.pkl)
+#   meta.json          kind, dim, n_faces, build parameters
+#   IVF  (pure NumPy, always available)
+#     centroids.npy    float32 (nlist, dim)   spherical k-means centres
+#     list_indptr.npy  int64   (nlist + 1,)   inverted-list boundaries ...
+#     list_ids.npy     int32   (n_faces,)     ... face row of each entry
+#     vectors.npy      float32 (n_faces, dim) embeddings, grouped by list
+#   HNSW (needs the optional hnswlib package)
+#     hnsw.bin         hnswlib graph (inner-product space)
+#
+# Rows are the bundle's face rows (see index_bundle.py).
+import os
+import json
+import time
+import argparse
+import numpy as np
+from matcher import normalize_rows, top_k
+from index_bundle import BUNDLE_DIR, write_array_dir, load_face_embeddings
+
+try:
+    import hnswlib
+except ImportError:  # optional: the IVF index needs nothing beyond NumPy
+    hnswlib = None
+
+ANN_DIR = "ann_index"
+FORMAT_VERSION = 1
+
+
+def spherical_kmeans(x, k, n_iter=20, sample_size=None, seed=0, chunk=65536):
+    """k-means on the unit sphere (cosine); x must be L2-normalised.
+
+    Trains on a random sample of at most sample_size rows (default 256 per
+    centre), which is plenty for a coarse quantizer.
+    """
+    rng = np.random.default_rng(seed)
+    n = x.shape[0]
+    sample_size = sample_size or 256 * k
+    train = x[rng.choice(n, sample_size, replace=False)] if n > sample_size else np.asarray(x)
+    centroids = train[rng.choice(train.shape[0], k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = _assign(train, centroids, chunk)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty centres on random training points
+            sums[empty] = train[rng.choice(train.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def _assign(x, centroids, chunk=65536):
+    # Nearest centre of every row, chunked to bound the (rows x k) score matrix
+    assign = np.empty(x.shape[0], dtype=np.int64)
+    for i in range(0, x.shape[0], chunk):
+        assign[i:i + chunk] = np.argmax(x[i:i + chunk] @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """Inverted-file index: k-means lists, scanning the nprobe closest per query.
+
+    Vectors are stored grouped by list, so each probed list is scored with
+    one contiguous matrix-vector product. nprobe trades recall for latency
+    (nprobe = nlist is exact search).
+    """
+
+    kind = "ivf"
+
+    def __init__(self, centroids, list_indptr, list_ids, vectors, nprobe=16):
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_ids = list_ids
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.params = {"nlist": int(centroids.shape[0])}
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, n_iter=20, seed=0, nprobe=16):
+        x = np.ascontiguousarray(normalize_rows(np.asarray(embeddings, dtype=np.float32)))
+        n = x.shape[0]
+        # ~4 sqrt(n) lists keeps both the centroid scan and each list short
+        nlist = max(1, min(nlist or int(4 * np.sqrt(n)), n))
+        centroids = spherical_kmeans(x, nlist, n_iter=n_iter, seed=seed)
+        assign = _assign(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        list_indptr = np.zeros(nlist + 1, dtype=np.int64)
+        list_indptr[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+        index = cls(centroids, list_indptr, order.astype(np.int32), np.ascontiguousarray(x[order]), nprobe)
+        index.params.update({"n_iter": n_iter, "seed": seed})
+        return index
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def search(self, query, k=10):
+        """(face rows, scores) of the k most similar stored faces, best first."""
+        q = normalize_rows(np.asarray(query, dtype=np.float32).reshape(-1))
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        lists = top_k(self.centroids @ q, nprobe)
+        starts, ends = self.list_indptr[lists], self.list_indptr[lists + 1]
+        sims = np.concatenate([self.vectors[s:e] @ q for s, e in zip(starts, ends)])
+        ids = np.concatenate([self.list_ids[s:e] for s, e in zip(starts, ends)])
+        best = top_k(sims, k)
+        return ids[best], sims[best]
+
+    def search_many(self, queries, k=10):
+        return [self.search(q, k) for q in np.atleast_2d(queries)]
+
+    def arrays(self):
+        return {"centroids": self.centroids, "list_indptr": self.list_indptr,
+                "list_ids": self.list_ids, "vectors": self.vectors}
+
+    @classmethod
+    def load(cls, path, meta, nprobe=16):
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                  for name in ("centroids", "list_indptr", "list_ids", "vectors")]
+        index = cls(*arrays, nprobe=nprobe)
+        index.params = meta["params"]
+        return index
+
+
+class HNSWIndex:
+    """hnswlib graph index; ef (>= k) trades recall for latency."""
+
+    kind = "hnsw"
+
+    def __init__(self, graph, n, dim, ef=64):
+        self.graph = graph
+        self.n = n
+        self._dim = dim
+        self.ef = ef
+        self.params = {}
+
+    @classmethod
+    def build(cls, embeddings, M=32, ef_construction=200, seed=0, ef=64):
+        if hnswlib is None:
+            raise ImportError("HNSW needs the hnswlib package (pip install hnswlib); use kind='ivf'")
+        x = np.ascontiguousarray(normalize_rows(np.asarray(embeddings, dtype=np.float32)))
+        n, dim = x.shape
+        graph = hnswlib.Index(space="ip", dim=dim)
+        graph.init_index(max_elements=max(n, 1), ef_construction=ef_construction, M=M, random_seed=seed)
+        graph.add_items(x, np.arange(n))
+        index = cls(graph, n, dim, ef)
+        index.params = {"M": M, "ef_construction": ef_construction, "seed": seed}
+        return index
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def dim(self):
+        return self._dim
+
+    def search(self, query, k=10):
+        ids, scores = self.search_many(np.asarray(query, dtype=np.float32).reshape(1, -1), k)[0]
+        return ids, scores
+
+    def search_many(self, queries, k=10):
+        q = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        k = min(k, self.n)
+        self.graph.set_ef(max(self.ef, k))
+        labels, distances = self.graph.knn_query(q, k=k)
+        # "ip" distance is 1 - inner product
+        return [(row.astype(np.int64), (1.0 - dist).astype(np.float32)) for row, dist in zip(labels, distances)]
+
+    def arrays(self):
+        return {}
+
+    def write_files(self, path):
+        self.graph.save_index(os.path.join(path, "hnsw.bin"))
+
+    @classmethod
+    def load(cls, path, meta, ef=64):
+        if hnswlib is None:
+            raise ImportError(f"{path} is an HNSW index, which needs the hnswlib package")
+        graph = hnswlib.Index(space="ip", dim=meta["dim"])
+        graph.load_index(os.path.join(path, "hnsw.bin"), max_elements=max(meta["n_faces"], 1))
+        index = cls(graph, meta["n_faces"], meta["dim"], ef)
+        index.params = meta["params"]
+        return index
+
+
+INDEX_KINDS = {"ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+def build_ann_index(embeddings, kind="auto", **params):
+    """Build an ANN index; kind="auto" is HNSW when hnswlib is installed, else IVF."""
+    if kind == "auto":
+        kind = "hnsw" if hnswlib is not None else "ivf"
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown ANN index kind {kind!r}, expected one of {', '.join(INDEX_KINDS)}")
+    return INDEX_KINDS[kind].build(embeddings, **params)
+
+
+def save_ann_index(index, path, build_seconds=None):
+    """Write an index directory; replaces `path` atomically."""
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "kind": index.kind,
+        "dim": int(index.dim),
+        "n_faces": len(index),
+        "params": index.params,
+        "build_seconds": round(build_seconds, 2) if build_seconds is not None else None,
+    }
+    return write_array_dir(path, index.arrays(), meta, getattr(index, "write_files", None))
+
+
+def ann_exists(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def load_ann_index(path, nprobe=16, ef=64):
+    """Open an index directory (IVF arrays are memory-mapped)."""
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported ANN index format {meta.get('format_version')!r}, "
+                         f"expected {FORMAT_VERSION}")
+    if meta["kind"] == "hnsw":
+        return HNSWIndex.load(path, meta, ef=ef)
+    return IVFIndex.load(path, meta, nprobe=nprobe)
+
+
+class AnnMatcher:
+    """FaceMatcher-compatible cluster matching through the face-level ANN index.
+
+    A query retrieves its search_k nearest stored faces (all of them, not
+    one representative per cluster); each cluster scores as its best face
+    among those hits. Returns the same (face_id, score) pairs as FaceMatcher.
+    """
+
+    def __init__(self, ann, face_clusters, ids, search_k=50):
+        # face_clusters[face_row] = index into ids of that face's cluster
+        self.ann = ann
+        self.face_clusters = np.asarray(face_clusters)
+        self.ids = [str(pid) for pid in ids]
+        self.search_k = search_k
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.ann.dim
+
+    def _vote(self, face_rows, scores, k, min_score):
+        clusters = self.face_clusters[face_rows]
+        # Hits are sorted best first, so a cluster's first hit is its best face
+        _, first = np.unique(clusters, return_index=True)
+        first.sort()
+        results = [(self.ids[clusters[i]], float(scores[i])) for i in first[:k]]
+        if min_score is not None:
+            results = [(pid, score) for pid, score in results if score >= min_score]
+        return results
+
+    def top_k(self, query, k=1):
+        return self.matches(query, k)
+
+    def best(self, query):
+        return self.top_k(query, 1)[0]
+
+    def matches(self, query, k=1, min_score=None):
+        face_rows, scores = self.ann.search(query, max(self.search_k, k))
+        return self._vote(face_rows, scores, k, min_score)
+
+    def matches_many(self, queries, k=1, min_score=None):
+        return [self._vote(rows, scores, k, min_score)
+                for rows, scores in self.ann.search_many(queries, max(self.search_k, k))]
+
+
+# Build ann_index/ from processed_data.pkl (or the bundle's face embeddings)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the ANN index over every face embedding")
+    parser.add_argument("--source", default="processed_data.pkl",
+                        help=f"processed_data.pkl, or a bundle directory such as {BUNDLE_DIR}")
+    parser.add_argument("--output", default=ANN_DIR)
+    parser.add_argument("--kind", default="auto", choices=["auto", *INDEX_KINDS])
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default 4 sqrt(n))")
+    parser.add_argument("--M", type=int, default=32, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings = load_face_embeddings(args.source)
+    print(f"Loaded {len(embeddings)} face embeddings.")
+
+    kind = args.kind if args.kind != "auto" else ("hnsw" if hnswlib is not None else "ivf")
+    params = {"nlist": args.nlist} if kind == "ivf" else {"M": args.M, "ef_construction": args.ef_construction}
+    start = time.time()
+    index = build_ann_index(embeddings, kind, **params)
+    meta = save_ann_index(index, args.output, time.time() - start)
+    print(f"✅ Built {meta['kind']} index over {meta['n_faces']} faces in {meta['build_seconds']} s "
+          f"({meta['params']}) -> '{args.output}/'")
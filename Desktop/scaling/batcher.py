@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import Counter
+
+
+class MicroBatcher:
+    """Collects items from concurrent requests and processes them in batches.
+
+    A batch is dispatched as soon as it holds max_batch_size items or the
+    oldest item has waited max_wait_ms, whichever comes first. `run_batch`
+    is an async callable that takes a list of items and returns one result
+    per item, in order. Batches are dispatched without waiting for the
+    previous one to finish, so a multi-worker pool stays busy.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0, max_queue=256):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        self._tasks = set()
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.last_batch_size = 0
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._record(batch)
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch):
+        # Requests that were cancelled while queued are dropped from the batch
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        waits = [(now - enqueued) * 1000.0 for _, _, enqueued in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self.last_batch_size = len(batch)
+        self.wait_ms_total += sum(waits)
+        self.wait_ms_max = max(self.wait_ms_max, max(waits))
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 3) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "mean_wait_ms": round(self.wait_ms_total / self.items, 3) if self.items else 0.0,
+            "max_wait_ms": round(self.wait_ms_max, 3),
+            "queue_depth": self.queue_depth(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms_setting": self.max_wait * 1000.0,
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._tasks):
+            task.cancel()
@@ -0,0 +1,120 @@
+# Bulk face matching for kiosks and the post-event email job.
+#
+#   python bulk_match.py selfies/ --output results.ndjson
+#
+# streams every image in a folder through decode -> detect -> embed -> match
+# and writes one JSON line per image. The API's /api/v1/bulk-match endpoint
+# uses the same record format for multipart batches.
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import pipeline
+from pipeline import UnreadableImage, NoFaceDetected
+from image_decode import ImageTooLarge
+from event_index import EventIndex
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def match_record(index, filename, matches=None, urls=None, error=None):
+    """One NDJSON result line (as a dict) for one input image."""
+    record = {"index": index, "filename": filename}
+    if error is not None:
+        record["error"] = error
+        return record
+    record["face_id"] = matches[0][0] if matches else None
+    record["matches"] = [{"face_id": pid, "score": round(float(score), 4)} for pid, score in matches]
+    record["imagePaths"] = urls
+    return record
+
+
+def iter_image_paths(image_dir):
+    for root, _, files in os.walk(image_dir):
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+
+def _detect_file(path, limits):
+    # Runs in the reader threads: read + decode + detect + align one image
+    try:
+        with open(path, "rb") as f:
+            contents = f.read()
+        return pipeline.detect_and_align(contents, limits), None
+    except (UnreadableImage, NoFaceDetected, ImageTooLarge, OSError) as e:
+        return None, str(e)
+
+
+def match_directory(image_dir, event_index, out, batch_size=32, workers=None,
+                    limits=None, top_k=1, min_score=None):
+    """Match every image under image_dir and write NDJSON lines to `out`.
+
+    Decoding and detection run in a thread pool; the aligned crops are
+    embedded batch_size at a time with one recognition call and matched
+    with one matrix product per batch. Returns (images, errors).
+    """
+    limits = limits or {}
+    paths = list(iter_image_paths(image_dir))
+    n_errors = 0
+
+    def flush(batch):
+        embeddings = pipeline.embed_crops([crop for _, _, crop in batch])
+        for (i, path, _), matches in zip(batch, event_index.matcher.matches_many(embeddings, top_k, min_score)):
+            urls = event_index.urls([pid for pid, _ in matches])
+            out.write(json.dumps(match_record(i, path, matches, urls)) + "\n")
+        out.flush()
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        batch = []
+        detections = pool.map(lambda p: _detect_file(p, limits), paths)
+        for i, (path, (crop, error)) in enumerate(zip(paths, detections)):
+            if error is not None:
+                n_errors += 1
+                out.write(json.dumps(match_record(i, path, error=error)) + "\n")
+                continue
+            batch.append((i, path, crop))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    return len(paths), n_errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match a folder of selfies against an event index")
+    parser.add_argument("image_dir", help="Folder of query images (searched recursively)")
+    parser.add_argument("--index-dir", default=".", help="Folder with cluster_representatives.pkl etc.")
+    parser.add_argument("--output", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Faces per recognition call")
+    parser.add_argument("--workers", type=int, default=None, help="Decode/detect threads")
+    parser.add_argument("--max-side", type=int, default=1280, help="Working resolution long side")
+    parser.add_argument("--top-k", type=int, default=1)
+    parser.add_argument("--min-similarity", type=float, default=None)
+    args = parser.parse_args()
+
+    pipeline.init_worker()
+    event_index = EventIndex.load(args.index_dir)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = time.time()
+    try:
+        n_images, n_errors = match_directory(
+            args.image_dir, event_index, out,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            limits={"max_side": args.max_side},
+            top_k=args.top_k,
+            min_score=args.min_similarity,
+        )
+    finally:
+        if args.output:
+            out.close()
+
+    duration = time.time() - start
+    print(f"✅ Matched {n_images - n_errors}/{n_images} images in {duration:.2f} s "
+          f"({n_images / duration if duration else 0:.1f} images/s)", file=sys.stderr)
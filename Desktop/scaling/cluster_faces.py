@@ -6,8 +6,10 @@ import cv2
 import numpy as np
 from sklearn.cluster import DBSCAN
 from collections import defaultdict
-from insightface.app import FaceAnalysis
 from tqdm import tqdm
+from index_bundle import write_bundle, BUNDLE_DIR
+from ann_index import build_ann_index, save_ann_index, ANN_DIR
+from prototypes import cluster_prototypes
 
 # Step 1: Load previously saved embeddings
 with open("processed_data.pkl", "rb") as f:
@@ -44,9 +46,8 @@ with open("person_to_photos.json", "w") as f:
 print("✅ Saved person-to-photo mapping as person_to_photos.json")
 
 # Step 6: Save one cropped face per person for UI thumbnails
+# (crops come from the stored bboxes, so no face model is needed here)
 print("📸 Saving thumbnails...")
-app = FaceAnalysis(name="buffalo_l")
-app.prepare(ctx_id=0)
 
 thumbnail_dir = "thumbnails"
 os.makedirs(thumbnail_dir, exist_ok=True)
@@ -89,17 +90,49 @@ for label, faces in tqdm(clusters.items()):
 print(f"✅ Thumbnails saved in 'thumbnails/' folder")
 print(f"❗ Skipped {skipped} problematic faces during thumbnail generation")
 
-# Step 7: Save one representative embedding per cluster (for face search)
+# Step 7: Save one representative embedding per cluster (for face search):
+# the normalised centroid, plus a few medoid prototypes for re-ranking
 print("📦 Saving cluster representative embeddings...")
 
-cluster_reps = {}
-
-for label, faces in clusters.items():
-    # Use first face's embedding as representative
-    rep_embedding = faces[0]["embedding"]
-    cluster_reps[label] = rep_embedding
+N_PROTOTYPES = int(os.environ.get("N_PROTOTYPES", 4))
+rep_labels = list(clusters.keys())
+centroids, proto_indptr, prototypes = cluster_prototypes(embeddings, labels, rep_labels, N_PROTOTYPES)
+cluster_reps = {label: centroids[row] for row, label in enumerate(rep_labels)}
 
 with open("cluster_representatives.pkl", "wb") as f:
     pickle.dump(cluster_reps, f)
 
 print("✅ Saved cluster representatives to 'cluster_representatives.pkl'")
+
+# Step 8: Save the memory-mapped index bundle the API loads at startup
+print("📦 Writing binary index bundle...")
+
+filename_to_drive_id = None
+if os.path.exists("drive_file_map.json"):
+    with open("drive_file_map.json", "r") as f:
+        filename_to_drive_id = json.load(f)
+
+meta = write_bundle(
+    BUNDLE_DIR,
+    face_data,
+    labels,
+    rep_labels,
+    centroids,
+    filename_to_drive_id,
+    prototypes=(proto_indptr, prototypes),
+)
+
+print(f"✅ Saved {meta['n_clusters']} clusters / {meta['n_faces']} faces / "
+      f"{meta['n_photos']} photos / {meta['n_prototypes']} prototypes to '{BUNDLE_DIR}/' "
+      f"(format v{meta['format_version']})")
+
+# Step 9: Build the ANN index over every face, so the API can match against
+# all of a person's faces instead of one representative
+print("🔎 Building ANN index over all faces...")
+
+start = time.time()
+ann = build_ann_index(embeddings, kind=os.environ.get("ANN_KIND", "auto"))
+ann_meta = save_ann_index(ann, ANN_DIR, time.time() - start)
+
+print(f"✅ Saved {ann_meta['kind']} index over {ann_meta['n_faces']} faces to '{ANN_DIR}/' "
+      f"in {ann_meta['build_seconds']} s")
@@ -0,0 +1,94 @@
+import csv
+import time
+import pickle
+import argparse
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from matcher import normalize_rows
+from embedding_store import build_store, store_nbytes, STORE_CODECS
+from ann_benchmark import load_embeddings, synthetic_embeddings, make_queries
+
+# ---------- SETUP ----------
+# Memory, search speed and top-1 agreement of each embedding codec against
+# full-precision cosine_similarity over the same faces, for queries from
+# ann_benchmark.make_queries.
+output_csv = "codec_benchmark_log.csv"
+
+
+def pickled_bytes_per_face(x, sample=1000):
+    # What processed_data.pkl spends per face on the embedding dict alone
+    entries = [{"filename": f"IMG_{i:05d}.jpg", "bbox": np.zeros(4, np.float32), "embedding": x[i]}
+               for i in range(min(sample, len(x)))]
+    return len(pickle.dumps(entries)) / max(len(entries), 1)
+
+
+def evaluate(search_many, queries, truth, k, batch):
+    """top-1 agreement, recall@k and ms/query (queries sent `batch` at a time)."""
+    start = time.perf_counter()
+    hits = []
+    for i in range(0, len(queries), batch):
+        hits.extend(rows for rows, _ in search_many(queries[i:i + batch], k))
+    ms_per_query = (time.perf_counter() - start) * 1000.0 / len(queries)
+    top1 = np.mean([len(rows) and rows[0] == t[0] for rows, t in zip(hits, truth)])
+    recall = np.mean([len(set(rows.tolist()) & set(t.tolist())) / len(t) for rows, t in zip(hits, truth)])
+    return float(top1), float(recall), ms_per_query
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding codecs vs. full-precision cosine_similarity")
+    parser.add_argument("--source", default="bundle",
+                        help="'bundle', a processed_data.pkl path, or 'synthetic'")
+    parser.add_argument("--synthetic-size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--noise", type=float, default=0.5, help="Query noise (relative norm)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 16], help="Queries per search call")
+    parser.add_argument("--codecs", nargs="+", default=list(STORE_CODECS), choices=list(STORE_CODECS))
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[32, 64, 128], help="PQ bytes per face")
+    args = parser.parse_args()
+
+    if args.source == "synthetic":
+        x = synthetic_embeddings(args.synthetic_size).astype(np.float32)
+    else:
+        x = np.asarray(load_embeddings(args.source), dtype=np.float32)
+    queries = make_queries(normalize_rows(x), args.queries, args.noise)
+    print(f"🚀 {x.shape[0]} faces x {x.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    # Reference: sklearn cosine_similarity on the float32 embeddings
+    def exact_search_many(q, k):
+        sims = cosine_similarity(q, x)
+        order = np.argsort(-sims, axis=1)[:, :k]
+        return [(row, s[row]) for row, s in zip(order, sims)]
+
+    truth = [rows for rows, _ in exact_search_many(queries, args.k)]
+    f32_mb = x.shape[0] * x.shape[1] * 4 / 1e6
+    rows = []
+
+    def record(name, nbytes, build_s, search_many):
+        for batch in args.batch:
+            top1, recall, ms = evaluate(search_many, queries, truth, args.k, batch)
+            rows.append({"codec": name, "batch": batch, "bytes_per_face": round(nbytes / x.shape[0], 1),
+                         "total_mb": round(nbytes / 1e6, 1), "compression": round(f32_mb * 1e6 / nbytes, 1),
+                         "top1_agreement": round(top1, 4), "recall": round(recall, 4),
+                         "ms_per_query": round(ms, 3), "build_s": round(build_s, 2)})
+            print(f"   {name:<12} batch={batch:<3} {nbytes / x.shape[0]:>7.1f} B/face  "
+                  f"top-1 {top1:.3f}  recall@{args.k} {recall:.3f}  {ms:8.3f} ms/query")
+
+    print(f"   (processed_data.pkl: ~{pickled_bytes_per_face(x):.0f} B/face)")
+    record("cosine", x.nbytes, 0.0, exact_search_many)
+
+    for codec in args.codecs:
+        for params in ([{"m": m} for m in args.pq_m if x.shape[1] % m == 0] if codec == "pq" else [{}]):
+            start = time.time()
+            store = build_store(x, codec, **params)
+            build_s = time.time() - start
+            name = f"pq m={params['m']}" if codec == "pq" else codec
+            record(name, store_nbytes(store), build_s, store.search_many)
+
+    # ---------- SAVE RESULTS ----------
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n✅ Done! 📁 Results saved to: {output_csv}")
@@ -0,0 +1,291 @@
+# Compact store of every face embedding, written by preprocess_faces.py when
+# EMBEDDING_CODEC is set (or by `python embedding_store.py`).
+#
+# embedding_store/
+#   meta.json        codec, dim, n_faces, codec parameters
+#   float16          codes.npy      float16 (n_faces, dim)               1 KB/face
+#   int8             codes.npy      int8    (n_faces, dim)             0.5 KB/face
+#                    scales.npy     float32 (n_faces,)   per-face scale
+#   pq               codes.npy      uint8   (m, n_faces)                 m B/face
+#                    codebooks.npy  float32 (m, 256, dim / m)
+#
+# Rows are the bundle's face rows (see index_bundle.py). Queries stay float32
+# and are scored against the codes directly (asymmetric distance), so the
+# full-precision vectors never have to be in memory.
+import os
+import abc
+import json
+import time
+import argparse
+import numpy as np
+from matcher import normalize_rows, top_k
+from index_bundle import BUNDLE_DIR, write_array_dir, load_face_embeddings
+
+STORE_DIR = "embedding_store"
+FORMAT_VERSION = 1
+
+
+def _kmeans(x, k, n_iter=20, seed=0):
+    # Plain (Euclidean) k-means, for the PQ sub-codebooks
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(x.shape[0], k, replace=x.shape[0] < k)].copy()
+    for _ in range(n_iter):
+        # argmin |x - c|^2 = argmax (x . c - |c|^2 / 2)
+        assign = np.argmax(x @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        # Per-dimension bincount is much faster than np.add.at for short sub-vectors
+        sums = np.stack([np.bincount(assign, weights=x[:, d], minlength=k) for d in range(x.shape[1])], axis=1)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(x.shape[0], int(empty.sum()))]
+    return centroids
+
+
+class _ScanStore(abc.ABC):
+    """Exhaustive scan over codes that convert row-wise to float32.
+
+    Rows are converted a chunk at a time, so a scan never holds more than
+    chunk x dim floats; several queries share each converted chunk.
+    """
+
+    chunk = 1024  # small enough for the converted block to stay in cache
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def dim(self):
+        return self.codes.shape[1]
+
+    @abc.abstractmethod
+    def _block_scores(self, qt, start, end):
+        """(end - start, n_queries) scores of rows start:end; qt is (dim, n_queries)."""
+
+    def _scores(self, q):
+        # q: (n_queries, dim) -> (n_queries, n_faces) approximate cosine
+        sims = np.empty((len(self), q.shape[0]), dtype=np.float32)
+        qt = np.ascontiguousarray(q.T)
+        for start in range(0, len(self), self.chunk):
+            end = min(start + self.chunk, len(self))
+            sims[start:end] = self._block_scores(qt, start, end)
+        return sims.T
+
+    def search(self, query, k=10):
+        """(face rows, scores) of the k most similar stored faces, best first."""
+        return self.search_many(np.asarray(query, dtype=np.float32).reshape(1, -1), k)[0]
+
+    def search_many(self, queries, k=10):
+        q = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        results = []
+        for sims in self._scores(q):
+            best = top_k(sims, k)
+            results.append((best, sims[best]))
+        return results
+
+
+class Float16Store(_ScanStore):
+    """Half-precision embeddings: 2x smaller, scores within ~1e-3.
+
+    NumPy converts float16 in software, so a single-query scan is several
+    times slower than float32; batched queries amortise the conversion.
+    """
+
+    kind = "float16"
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.params = {}
+
+    @classmethod
+    def build(cls, embeddings):
+        x = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        return cls(np.ascontiguousarray(x.astype(np.float16)))
+
+    def _block_scores(self, qt, start, end):
+        return self.codes[start:end].astype(np.float32) @ qt
+
+    def arrays(self):
+        return {"codes": self.codes}
+
+    @classmethod
+    def load(cls, path, meta):
+        return cls(np.load(os.path.join(path, "codes.npy"), mmap_mode="r"))
+
+
+class Int8Store(_ScanStore):
+    """Symmetric int8 codes with one float scale per face: 4x smaller."""
+
+    kind = "int8"
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+        self.params = {}
+
+    @classmethod
+    def build(cls, embeddings):
+        x = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        scales = np.abs(x).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8)
+        return cls(np.ascontiguousarray(codes), scales.astype(np.float32))
+
+    def _block_scores(self, qt, start, end):
+        # Scale after the product: one multiply per face instead of per value
+        return (self.codes[start:end].astype(np.float32) @ qt) * self.scales[start:end, None]
+
+    def arrays(self):
+        return {"codes": self.codes, "scales": self.scales}
+
+    @classmethod
+    def load(cls, path, meta):
+        return cls(np.load(os.path.join(path, "codes.npy"), mmap_mode="r"),
+                   np.load(os.path.join(path, "scales.npy"), mmap_mode="r"))
+
+
+class PQStore:
+    """Product quantization: m sub-vectors, each one byte into a 256-entry codebook.
+
+    A query is split the same way and scored against every codebook entry
+    once (an m x 256 lookup table); a face's score is then the sum of m
+    table lookups, with no decoding. 512-d ArcFace vectors with m=64 take
+    64 bytes per face, 32x smaller than float32. Codes are stored one
+    sub-quantizer per row, so each lookup pass reads contiguous bytes.
+    """
+
+    kind = "pq"
+    chunk = 65536
+
+    def __init__(self, codes, codebooks):
+        self.codes = codes  # (m, n_faces)
+        self.codebooks = codebooks
+        self.params = {"m": int(codebooks.shape[0]), "ksub": int(codebooks.shape[1])}
+
+    @classmethod
+    def build(cls, embeddings, m=64, ksub=256, n_iter=20, sample_size=65536, seed=0):
+        x = np.ascontiguousarray(normalize_rows(np.asarray(embeddings, dtype=np.float32)))
+        n, dim = x.shape
+        if dim % m:
+            raise ValueError(f"PQ needs dim ({dim}) divisible by m ({m})")
+        dsub = dim // m
+        rng = np.random.default_rng(seed)
+        train = x[rng.choice(n, sample_size, replace=False)] if n > sample_size else x
+        ksub = min(ksub, 256)
+
+        codebooks = np.zeros((m, ksub, dsub), dtype=np.float32)
+        codes = np.empty((m, n), dtype=np.uint8)
+        for j in range(m):
+            sub = slice(j * dsub, (j + 1) * dsub)
+            codebooks[j] = _kmeans(np.ascontiguousarray(train[:, sub]), ksub, n_iter, seed + j)
+            half_norms = 0.5 * (codebooks[j] ** 2).sum(axis=1)
+            for start in range(0, n, cls.chunk):
+                block = x[start:start + cls.chunk, sub]
+                codes[j, start:start + cls.chunk] = np.argmax(block @ codebooks[j].T - half_norms, axis=1)
+        store = cls(codes, codebooks)
+        store.params.update({"n_iter": n_iter, "seed": seed})
+        return store
+
+    def __len__(self):
+        return self.codes.shape[1]
+
+    @property
+    def dim(self):
+        return self.codebooks.shape[0] * self.codebooks.shape[2]
+
+    def _lookup_table(self, q):
+        # (m, ksub): each query sub-vector against each codebook entry
+        m, _, dsub = self.codebooks.shape
+        return np.einsum("mkd,md->mk", self.codebooks, q.reshape(m, dsub))
+
+    def _scores(self, q):
+        table = self._lookup_table(q)
+        sims = np.zeros(len(self), dtype=np.float32)
+        for j in range(table.shape[0]):
+            sims += np.take(table[j], self.codes[j])
+        return sims
+
+    def search(self, query, k=10):
+        """(face rows, approximate scores) of the k most similar stored faces, best first."""
+        q = normalize_rows(np.asarray(query, dtype=np.float32).reshape(-1))
+        sims = self._scores(q)
+        best = top_k(sims, k)
+        return best, sims[best]
+
+    def search_many(self, queries, k=10):
+        return [self.search(q, k) for q in np.atleast_2d(queries)]
+
+    def arrays(self):
+        return {"codes": self.codes, "codebooks": self.codebooks}
+
+    @classmethod
+    def load(cls, path, meta):
+        store = cls(np.load(os.path.join(path, "codes.npy"), mmap_mode="r"),
+                    np.load(os.path.join(path, "codebooks.npy")))
+        store.params = meta["params"]
+        return store
+
+
+STORE_CODECS = {"float16": Float16Store, "int8": Int8Store, "pq": PQStore}
+
+
+def build_store(embeddings, codec="pq", **params):
+    if codec not in STORE_CODECS:
+        raise ValueError(f"Unknown embedding codec {codec!r}, expected one of {', '.join(STORE_CODECS)}")
+    return STORE_CODECS[codec].build(embeddings, **params)
+
+
+def save_store(store, path, build_seconds=None):
+    """Write a store directory; replaces `path` atomically."""
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "codec": store.kind,
+        "dim": int(store.dim),
+        "n_faces": len(store),
+        "bytes_per_face": round(store_nbytes(store) / max(len(store), 1), 1),
+        "params": store.params,
+        "build_seconds": round(build_seconds, 2) if build_seconds is not None else None,
+    }
+    return write_array_dir(path, store.arrays(), meta)
+
+
+def store_nbytes(store):
+    """Bytes held by the store's arrays (codes plus scales/codebooks)."""
+    return sum(array.nbytes for array in store.arrays().values())
+
+
+def store_exists(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def load_store(path):
+    """Open a store directory (codes are memory-mapped)."""
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported embedding store format {meta.get('format_version')!r}, "
+                         f"expected {FORMAT_VERSION}")
+    if meta["codec"] not in STORE_CODECS:
+        raise ValueError(f"{path}: unknown embedding codec {meta['codec']!r}")
+    return STORE_CODECS[meta["codec"]].load(path, meta)
+
+
+# Build embedding_store/ from processed_data.pkl (or the bundle's face embeddings)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the compact embedding store")
+    parser.add_argument("--source", default="processed_data.pkl",
+                        help=f"processed_data.pkl, or a bundle directory such as {BUNDLE_DIR}")
+    parser.add_argument("--output", default=STORE_DIR)
+    parser.add_argument("--codec", default="pq", choices=list(STORE_CODECS))
+    parser.add_argument("--m", type=int, default=64, help="PQ sub-vectors (bytes per face)")
+    args = parser.parse_args()
+
+    embeddings = load_face_embeddings(args.source)
+    print(f"Loaded {len(embeddings)} face embeddings.")
+
+    start = time.time()
+    store = build_store(embeddings, args.codec, **({"m": args.m} if args.codec == "pq" else {}))
+    meta = save_store(store, args.output, time.time() - start)
+    print(f"✅ Encoded {meta['n_faces']} faces as {meta['codec']} ({meta['bytes_per_face']} B/face) "
+          f"in {meta['build_seconds']} s -> '{args.output}/'")
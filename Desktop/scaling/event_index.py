@@ -0,0 +1,391 @@
+import base64
+import functools
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+from matcher import FaceMatcher
+from index_bundle import IndexBundle, BUNDLE_DIR
+from ann_index import AnnMatcher, ANN_DIR, ann_exists, load_ann_index
+from prototypes import PrototypeMatcher
+from embedding_store import STORE_DIR, STORE_CODECS, store_exists, load_store
+from photo_index import PHOTO_INDEX_DIR, PhotoIndex, PhotoRetriever, ExactFaceSearch, photo_index_exists
+
+logger = logging.getLogger("event_index")
+
+# How a query is matched to clusters: "clusters" scores one representative
+# per cluster; "prototypes" shortlists clusters by centroid and re-ranks them
+# by their medoid prototypes; "ann" searches every face through ann_index/;
+# "compressed" scans every face's codes in embedding_store/ (all three need
+# the bundle); "auto" picks prototypes, then compressed, then ann, then
+# clusters, whichever is there first. Prototypes come first because their
+# cost per query is fixed and they keep a cluster's poses apart; the
+# face-level indexes are opt-in (retrieval=faces uses them either way)
+MATCH_INDEXES = ("auto", "ann", "compressed", "prototypes", "clusters")
+
+
+def get_drive_url(file_id):
+    return f"https://lh3.googleusercontent.com/d/{file_id}=w600"
+
+# https://lh3.googleusercontent.com/d/1RStarVhCtarEPNFTmBQdlfxWd8daSU_M=w800
+
+
+def index_version(data):
+    # Derived from the index files, so every worker that loaded the same
+    # files agrees on it (unlike the per-process reload generation)
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def encode_cursor(offset, face_ids, version):
+    # Self-contained: which ids the offset indexes into, and which index
+    # version numbered them (cluster ids change when DBSCAN re-runs)
+    payload = json.dumps([version, ",".join(face_ids), offset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(version, face_ids, offset) of a cursor from encode_cursor.
+
+    Raises ValueError for anything that isn't a cursor we handed out.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        version, face_ids, offset = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if not isinstance(face_ids, str) or not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return version, face_ids.split(","), offset
+
+
+def _bundle_drive_id(bundle_names, bundle_drive_ids, photo_names, photo_id):
+    # Drive id of photo_names[photo_id] per the bundle; photo_names there are sorted
+    name = photo_names[photo_id]
+    row = int(np.searchsorted(bundle_names, name))
+    if row < len(bundle_names) and bundle_names[row] == name:
+        return bundle_drive_ids[row].decode()
+    return None
+
+
+class EventIndex:
+    """Match index plus ready-to-send results for one event.
+
+    Each person's photo list is resolved to Drive URLs and serialised to JSON
+    once, so a request only has to splice the pre-encoded bytes into its
+    response. Indexes loaded from pickle/JSON do this for everyone at load
+    time; bundle-backed indexes do it the first time a person is matched,
+    so startup stays independent of the event size.
+    """
+
+    def __init__(self, matcher, person_ids, resolve_urls, precompute=True):
+        # resolve_urls(face_id) -> list of Drive URLs for that person
+        self.matcher = matcher
+        self.person_ids = frozenset(person_ids)
+        self._resolve_urls = resolve_urls
+        self.person_urls = {}
+        self.person_payloads = {}
+        # Identifies the clustering the face ids belong to; set by load()
+        self.version = None
+        # Direct face -> photo retrieval (see attach_photos); None if the
+        # directory has neither photo_index/ nor a bundle
+        self.photos = None
+        self._photo_file_id = None
+        if precompute:
+            for pid in self.person_ids:
+                self._resolve(pid)
+
+    @classmethod
+    def from_files(cls, matcher, person_to_photos, filename_to_drive_id):
+        def resolve_urls(pid):
+            urls = []
+            for path in person_to_photos[pid]:
+                file_id = filename_to_drive_id.get(os.path.basename(path))
+                if file_id:
+                    urls.append(get_drive_url(file_id))
+            return urls
+
+        return cls(matcher, person_to_photos.keys(), resolve_urls)
+
+    @classmethod
+    def from_bundle(cls, bundle, filename_to_drive_id=None, ann=None, ann_search_k=50,
+                    use_prototypes=False, proto_coarse_k=32):
+        labels = [str(label) for label in bundle.rep_labels.tolist()]
+        row_of = {pid: row for row, pid in enumerate(labels)}
+        if ann is not None:
+            # Cluster row of every face, for voting over the face-level hits
+            order = np.argsort(bundle.rep_labels)
+            face_clusters = order[np.searchsorted(bundle.rep_labels[order], bundle.face_labels)]
+            matcher = AnnMatcher(ann, face_clusters, labels, ann_search_k)
+        elif use_prototypes:
+            matcher = PrototypeMatcher(labels, bundle.rep_embeddings, bundle.proto_indptr,
+                                       bundle.proto_embeddings, proto_coarse_k)
+        else:
+            matcher = FaceMatcher.from_normalized(labels, bundle.rep_embeddings)
+
+        def resolve_urls(pid):
+            urls = []
+            for photo_id in bundle.person_photo_ids(row_of[pid]).tolist():
+                if bundle.photo_drive_ids is not None:
+                    file_id = bundle.photo_drive_ids[photo_id].decode()
+                else:
+                    file_id = filename_to_drive_id.get(bundle.photo_name(photo_id))
+                if file_id:
+                    urls.append(get_drive_url(file_id))
+            return urls
+
+        index = cls(matcher, labels, resolve_urls, precompute=False)
+        index.bundle = bundle
+        return index
+
+    @classmethod
+    def load(cls, directory=".", match_index="auto", ann_search_k=50, ann_nprobe=16, ann_ef=64,
+             proto_coarse_k=32, photo_search_k=200):
+        index, bundle, ann = cls._load_matching(directory, match_index, ann_search_k, ann_nprobe, ann_ef,
+                                                proto_coarse_k)
+        index.attach_photos(directory, bundle, ann, photo_search_k, ann_nprobe, ann_ef)
+        return index
+
+    @classmethod
+    def _load_matching(cls, directory, match_index, ann_search_k, ann_nprobe, ann_ef, proto_coarse_k):
+        # -> (index, bundle or None, face-level searcher or None)
+        if match_index not in MATCH_INDEXES:
+            raise ValueError(f"Unknown match index {match_index!r}, expected one of {', '.join(MATCH_INDEXES)}")
+        bundle_path = os.path.join(directory, BUNDLE_DIR)
+        ann_path = os.path.join(directory, ANN_DIR)
+        store_path = os.path.join(directory, STORE_DIR)
+        if IndexBundle.exists(bundle_path):
+            bundle = IndexBundle(bundle_path)
+            filename_to_drive_id = None
+            if bundle.photo_drive_ids is None:
+                with open(os.path.join(directory, "drive_file_map.json"), "r") as f:
+                    filename_to_drive_id = json.load(f)
+            has_prototypes = bundle.proto_embeddings is not None
+            if match_index == "prototypes" and not has_prototypes:
+                raise ValueError(f"{bundle_path} has no prototypes; re-run cluster_faces.py")
+            use_prototypes = match_index == "prototypes" or (match_index == "auto" and has_prototypes)
+            # auto only falls back to a face-level index for bundles without prototypes
+            auto_faces = match_index == "auto" and not has_prototypes
+            ann = None
+            # A compact store, when present, is preferred over the float32 ANN
+            # vectors: that is the point of writing one
+            if match_index == "ann" or (auto_faces and ann_exists(ann_path) and not store_exists(store_path)):
+                ann = load_ann_index(ann_path, nprobe=ann_nprobe, ef=ann_ef)
+                if len(ann) != bundle.meta["n_faces"] or ann.dim != bundle.meta["dim"]:
+                    if match_index == "ann":
+                        raise ValueError(f"{ann_path} does not match {bundle_path}; rebuild it")
+                    # Stale: cluster_faces.py has not finished rebuilding it yet
+                    logger.warning("⚠️ %s does not match %s; matching against clusters", ann_path, bundle_path)
+                    ann = None
+            if ann is None and (match_index == "compressed" or (auto_faces and store_exists(store_path))):
+                # Same face-level search interface as the ANN indexes
+                ann = load_store(store_path)
+                if len(ann) != bundle.meta["n_faces"] or ann.dim != bundle.meta["dim"]:
+                    if match_index == "compressed":
+                        raise ValueError(f"{store_path} does not match {bundle_path}; rebuild it")
+                    logger.warning("⚠️ %s does not match %s; not using it", store_path, bundle_path)
+                    ann = None
+            index = cls.from_bundle(bundle, filename_to_drive_id, ann, ann_search_k,
+                                    use_prototypes, proto_coarse_k)
+            # meta.json carries the build time, so a re-clustered bundle gets a new version
+            index.version = index_version(json.dumps(bundle.meta, sort_keys=True).encode())
+            return index, bundle, ann
+
+        if match_index in ("ann", "compressed", "prototypes"):
+            raise ValueError(f"match_index={match_index!r} needs {bundle_path} (run cluster_faces.py)")
+
+        matcher = FaceMatcher.from_pickle(os.path.join(directory, "cluster_representatives.pkl"))
+
+        with open(os.path.join(directory, "person_to_photos.json"), "rb") as f:
+            person_to_photos_json = f.read()
+        person_to_photos = json.loads(person_to_photos_json)
+
+        with open(os.path.join(directory, "drive_file_map.json"), "r") as f:
+            filename_to_drive_id = json.load(f)
+
+        index = cls.from_files(matcher, person_to_photos, filename_to_drive_id)
+        index.version = index_version(person_to_photos_json)
+        return index, None, None
+
+    def attach_photos(self, directory, bundle=None, ann=None, search_k=200, ann_nprobe=16, ann_ef=64):
+        """Set up face -> photo retrieval from photo_index/ (or the bundle's copy).
+
+        Faces are searched through the compressed store or the ANN index
+        (in that order) when one covers the same face rows, else by an exact
+        scan, which needs the float32 embeddings.
+        """
+        photo_path = os.path.join(directory, PHOTO_INDEX_DIR)
+        if photo_index_exists(photo_path):
+            photos = PhotoIndex.load(photo_path)
+            drive_ids = None
+        elif bundle is not None:
+            photos = PhotoIndex.from_bundle(bundle)
+            drive_ids = bundle.photo_drive_ids
+        else:
+            return
+
+        ann_path = os.path.join(directory, ANN_DIR)
+        store_path = os.path.join(directory, STORE_DIR)
+        face_search = ann
+        if store_exists(store_path) and getattr(ann, "kind", None) not in STORE_CODECS:
+            face_search = load_store(store_path)
+        elif face_search is None and ann_exists(ann_path):
+            face_search = load_ann_index(ann_path, nprobe=ann_nprobe, ef=ann_ef)
+        if face_search is None or len(face_search) != len(photos) or face_search.dim != photos.dim:
+            if photos.face_embeddings is None:
+                logger.warning("⚠️ %s has no embeddings and no matching store; face -> photo retrieval disabled",
+                               photo_path)
+                return
+            face_search = ExactFaceSearch(photos.face_embeddings)
+
+        map_path = os.path.join(directory, "drive_file_map.json")
+        if drive_ids is not None:
+            self._photo_file_id = lambda photo_id: drive_ids[photo_id].decode()
+        elif bundle is not None and bundle.photo_drive_ids is not None:
+            # photo_index/ numbers photos on its own; look each hit's filename
+            # up in the bundle's sorted photo_names, so loading parses nothing
+            self._photo_file_id = functools.partial(
+                _bundle_drive_id, bundle.photo_names, bundle.photo_drive_ids, photos.photo_names
+            )
+        elif os.path.exists(map_path):
+            with open(map_path, "r") as f:
+                filename_to_drive_id = json.load(f)
+            self._photo_file_id = lambda photo_id: filename_to_drive_id.get(photos.photo_name(photo_id))
+        else:
+            logger.warning("⚠️ No Drive ids for %s; face -> photo retrieval disabled", photo_path)
+            return
+        self.photos = PhotoRetriever(photos, face_search, search_k)
+
+    def photo_results(self, hits):
+        """[(photo_id, score)] -> ([url, ...], [score, ...]), photos without a Drive id dropped."""
+        urls, scores = [], []
+        for photo_id, score in hits:
+            file_id = self._photo_file_id(photo_id)
+            if file_id:
+                urls.append(get_drive_url(file_id))
+                scores.append(round(score, 4))
+        return urls, scores
+
+    def has_person(self, face_id):
+        return face_id in self.person_ids
+
+    def _resolve(self, face_id):
+        urls = self._resolve_urls(face_id)
+        self.person_urls[face_id] = urls
+        self.person_payloads[face_id] = json.dumps(urls).encode()
+
+    def _person_urls(self, face_id):
+        if face_id not in self.person_urls:
+            if face_id not in self.person_ids:
+                return []
+            self._resolve(face_id)
+        return self.person_urls[face_id]
+
+    def _person_payload(self, face_id):
+        if face_id not in self.person_payloads:
+            if face_id not in self.person_ids:
+                return b"[]"
+            self._resolve(face_id)
+        return self.person_payloads[face_id]
+
+    def urls(self, face_ids):
+        """Photo URLs of one person, or the de-duplicated union for several."""
+        if isinstance(face_ids, str):
+            return self._person_urls(face_ids)
+        if len(face_ids) == 1:
+            return self._person_urls(face_ids[0])
+        # One person split over several clusters shares photos between them
+        return list(dict.fromkeys(url for pid in face_ids for url in self._person_urls(pid)))
+
+    def render_match(self, request_id, matches):
+        """JSON body of a match response, as bytes.
+
+        matches: [(face_id, score), ...], best first. A single match splices
+        in the pre-serialised URL list; several are merged into one list.
+        """
+        face_ids = [pid for pid, _ in matches]
+        if len(face_ids) == 1:
+            image_paths = self._person_payload(face_ids[0])
+        else:
+            image_paths = json.dumps(self.urls(face_ids)).encode()
+        return b'{"request_id": %s, "face_id": %s, "matches": %s, "imagePaths": %s}' % (
+            json.dumps(request_id).encode(),
+            json.dumps(face_ids[0] if face_ids else None).encode(),
+            json.dumps(_match_list(matches)).encode(),
+            image_paths,
+        )
+
+    def render_page(self, request_id, face_ids, offset=0, limit=12, matches=None):
+        """JSON body with one page of photos plus a cursor for the next."""
+        urls = self.urls(face_ids)
+        end = offset + limit
+        next_cursor = encode_cursor(end, face_ids, self.version) if end < len(urls) else None
+        body = {
+            "request_id": request_id,
+            # Every matched id, since the cursor's offsets index their union
+            "face_id": ",".join(face_ids) or None,
+            "imagePaths": urls[offset:end],
+            "totalCount": len(urls),
+            "nextCursor": next_cursor,
+            "indexVersion": self.version,
+        }
+        if matches is not None:
+            body["matches"] = _match_list(matches)
+        return json.dumps(body).encode()
+
+    def render_group(self, request_id, faces, page_size=0):
+        """JSON body for a group photo: one result per detected face.
+
+        faces: [{"bbox": [x1, y1, x2, y2], "det_score": float, "matches": [...]}]
+        With page_size > 0 each face carries only its first page plus a cursor.
+        """
+        results = []
+        for face in faces:
+            face_ids = [pid for pid, _ in face["matches"]]
+            urls = self.urls(face_ids)
+            result = {
+                "bbox": [round(float(v), 1) for v in face["bbox"]],
+                "det_score": round(float(face["det_score"]), 4),
+                "face_id": ",".join(face_ids) or None,
+                "matches": _match_list(face["matches"]),
+                "totalCount": len(urls),
+            }
+            if page_size > 0:
+                result["imagePaths"] = urls[:page_size]
+                result["nextCursor"] = (encode_cursor(page_size, face_ids, self.version)
+                                        if page_size < len(urls) else None)
+            else:
+                result["imagePaths"] = urls
+            results.append(result)
+        return json.dumps({"request_id": request_id, "faces": results, "indexVersion": self.version}).encode()
+
+
+    def render_photos(self, request_id, hits):
+        """JSON body for face -> photo retrieval: photos ranked by best face score."""
+        urls, scores = self.photo_results(hits)
+        return json.dumps({
+            "request_id": request_id,
+            "face_id": None,
+            "imagePaths": urls,
+            "scores": scores,
+            "totalCount": len(urls),
+        }).encode()
+
+    def render_group_photos(self, request_id, faces):
+        """render_group for face -> photo retrieval; faces carry "photos" hits."""
+        results = []
+        for face in faces:
+            urls, scores = self.photo_results(face["photos"])
+            results.append({
+                "bbox": [round(float(v), 1) for v in face["bbox"]],
+                "det_score": round(float(face["det_score"]), 4),
+                "face_id": None,
+                "imagePaths": urls,
+                "scores": scores,
+                "totalCount": len(urls),
+            })
+        return json.dumps({"request_id": request_id, "faces": results}).encode()
+
+
+def _match_list(matches):
+    return [{"face_id": pid, "score": round(float(score), 4)} for pid, score in matches]
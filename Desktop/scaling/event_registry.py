@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import asyncio
+import functools
+import logging
+from collections import OrderedDict
+from index_reloader import IndexReloader, WATCHED_FILES
+from index_bundle import BUNDLE_DIR
+from ann_index import ANN_DIR
+from embedding_store import STORE_DIR, store_exists
+from photo_index import PHOTO_INDEX_DIR
+
+logger = logging.getLogger("event_registry")
+
+# Event ids name a sub-directory of the events root, so keep them to one
+# plain path component
+EVENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+DEFAULT_EVENT = "default"
+
+# float32 copies of every face embedding. With embedding_store/ present the
+# faces are searched through its codes instead, so these are never paged in
+# (unless MATCH_INDEX=ann is forced) and don't count against the budget.
+FLOAT32_FACE_FILES = (
+    os.path.join(BUNDLE_DIR, "face_embeddings.npy"),
+    os.path.join(PHOTO_INDEX_DIR, "face_embeddings.npy"),
+    os.path.join(ANN_DIR, "vectors.npy"),
+)
+
+
+class UnknownEvent(LookupError):
+    pass
+
+
+def index_footprint(directory):
+    """Bytes of the index files EventIndex.load reads from a directory.
+
+    Bundle, ANN and store arrays are memory-mapped, so this is what an
+    event can occupy in the page cache once it has been fully touched.
+    """
+    skip = set()
+    if store_exists(os.path.join(directory, STORE_DIR)):
+        skip = {os.path.join(directory, name) for name in FLOAT32_FACE_FILES}
+    total = 0
+    for name in {path.split(os.sep)[0] for path in WATCHED_FILES}:
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, f)) for f in files
+                             if os.path.join(root, f) not in skip)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def has_index(directory):
+    return any(os.path.exists(os.path.join(directory, name))
+               for name in (WATCHED_FILES[0], "cluster_representatives.pkl"))
+
+
+class EventRegistry:
+    """Match indexes of many events in one process, loaded on first use.
+
+    Event "<id>" is read from <events_root>/<id>/, laid out like the output
+    of cluster_faces.py. Each loaded event is an IndexReloader, so hot
+    reloads and per-request snapshots work per event. Once the loaded
+    events exceed max_bytes (index_footprint) or max_events, the least
+    recently used ones are dropped; requests still holding their index
+    finish on it. The default event (default_dir) is loaded eagerly and
+    never evicted. The face model is per process and shared by every event.
+    """
+
+    def __init__(self, events_root=None, default_dir=None, max_bytes=0, max_events=0,
+                 on_swap=None, on_load=None, **load_options):
+        self.events_root = events_root
+        self.max_bytes = max_bytes  # 0 = no budget
+        self.max_events = max_events  # 0 = no limit
+        self.on_swap = on_swap  # called with an event's new index after a reload
+        self.on_load = on_load  # called with an event's index after a lazy load
+        self.load_options = load_options  # passed on to EventIndex.load
+        self._events = OrderedDict()  # event_id -> (reloader, footprint), LRU order
+        self._loading = {}  # event_id -> asyncio.Lock
+        # Last generation per event, so a re-loaded event never reuses one
+        # (result-cache keys carry it)
+        self._generations = {}
+        self.loads = 0
+        self.evictions = 0
+
+        self.default_event = None
+        if default_dir:
+            self.default_event = DEFAULT_EVENT
+            self._events[DEFAULT_EVENT] = (
+                IndexReloader(default_dir, on_swap=on_swap, **load_options), index_footprint(default_dir)
+            )
+
+    def directory(self, event_id):
+        if event_id == DEFAULT_EVENT and self.default_event is not None:
+            return self._events[DEFAULT_EVENT][0].directory
+        if not self.events_root or not EVENT_ID_PATTERN.match(event_id):
+            raise UnknownEvent(f"Unknown event_id '{event_id}'.")
+        directory = os.path.join(self.events_root, event_id)
+        if not has_index(directory):
+            raise UnknownEvent(f"Unknown event_id '{event_id}'.")
+        return directory
+
+    def loaded(self, event_id=None):
+        """Reloader of an event that is already loaded, or None."""
+        entry = self._events.get(event_id or self.default_event)
+        return entry[0] if entry is not None else None
+
+    async def get(self, event_id=None):
+        """Reloader of an event, loading it (off the event loop) if needed.
+
+        Raises UnknownEvent for ids without an index directory, and when no
+        event_id is given and there is no default event.
+        """
+        event_id = event_id or self.default_event
+        if event_id is None:
+            raise UnknownEvent("event_id is required.")
+        if event_id in self._events:
+            self._events.move_to_end(event_id)
+            return self._events[event_id][0]
+
+        directory = self.directory(event_id)
+        lock = self._loading.setdefault(event_id, asyncio.Lock())
+        async with lock:
+            if event_id not in self._events:
+                # Concurrent first requests for one event share a single load
+                start = time.perf_counter()
+                generation = self._generations.get(event_id, -1) + 1
+                loop = asyncio.get_running_loop()
+                reloader = await loop.run_in_executor(None, functools.partial(
+                    IndexReloader, directory, self.on_swap, generation, **self.load_options
+                ))
+                footprint = index_footprint(directory)
+                self._events[event_id] = (reloader, footprint)
+                self.loads += 1
+                logger.info("📂 Event %s loaded in %.0f ms (%d clusters, %.1f MB)", event_id,
+                            (time.perf_counter() - start) * 1000.0, len(reloader.current.person_ids),
+                            footprint / 1e6)
+                if self.on_load is not None:
+                    self.on_load(reloader.current)
+                self._evict(keep=event_id)
+            self._loading.pop(event_id, None)
+        self._events.move_to_end(event_id)
+        return self._events[event_id][0]
+
+    def _evict(self, keep):
+        # Least recently used first; the default event and the one just
+        # loaded stay even if they alone exceed the budget
+        for event_id in list(self._events):
+            if not self._over_budget():
+                break
+            if event_id in (keep, self.default_event):
+                continue
+            reloader, footprint = self._events.pop(event_id)
+            self._generations[event_id] = reloader.generation
+            self.evictions += 1
+            logger.info("🗑️ Event %s evicted (%.1f MB)", event_id, footprint / 1e6)
+
+    def _over_budget(self):
+        if self.max_events and len(self._events) > self.max_events:
+            return True
+        return bool(self.max_bytes) and self.bytes_used > self.max_bytes
+
+    @property
+    def bytes_used(self):
+        return sum(footprint for _, footprint in self._events.values())
+
+    async def reload(self, event_id=None):
+        """Reload a loaded event from disk (see IndexReloader.reload)."""
+        reloader = self.loaded(event_id)
+        if reloader is None:
+            raise UnknownEvent(f"Event '{event_id or self.default_event}' is not loaded.")
+        stats = await reloader.reload()
+        entry_id = event_id or self.default_event
+        if entry_id in self._events:
+            self._events[entry_id] = (reloader, index_footprint(reloader.directory))
+        return stats
+
+    async def watch(self, interval=5.0):
+        """Reload loaded events whose index files changed on disk."""
+        while True:
+            await asyncio.sleep(interval)
+            for reloader, _ in list(self._events.values()):
+                await reloader.poll()
+
+    def stats(self):
+        return {
+            "events_loaded": len(self._events),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "max_events": self.max_events,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "events": {event_id: {**reloader.stats(), "bytes": footprint}
+                       for event_id, (reloader, footprint) in self._events.items()},
+        }
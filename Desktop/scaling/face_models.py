@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import hashlib
+import platform
+import argparse
+import cv2
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.model_zoo import ArcFaceONNX, RetinaFace, Landmark, Attribute
+from insightface.model_zoo.model_zoo import PickableInferenceSession, get_default_providers, get_default_provider_options
+from insightface.utils.storage import ensure_available
+
+# ONNX file of each module in the buffalo_l pack
+BUFFALO_L_FILES = {
+    "detection": "det_10g.onnx",
+    "recognition": "w600k_r50.onnx",
+    "genderage": "genderage.onnx",
+    "landmark_2d_106": "2d106det.onnx",
+    "landmark_3d_68": "1k3d68.onnx",
+}
+
+# Modules each stage actually uses. The pipeline only reads face.bbox and
+# face.embedding, so genderage and the two landmark models are dead weight.
+PROFILES = {
+    "full": tuple(BUFFALO_L_FILES),
+    "embed": ("detection", "recognition"),  # preprocess_faces.py, main.py
+    "detect": ("detection",),
+}
+
+
+# ONNX Runtime settings shared by every entry point (API, preprocessing,
+# benchmarks). Precedence: these defaults < JSON file named by ORT_CONFIG <
+# ORT_* environment variables.
+ORT_DEFAULTS = {
+    "providers": None,              # e.g. ["CPUExecutionProvider"]; None = CUDA if available, else CPU
+    "intra_op_threads": 0,          # 0 = ONNX Runtime default (one per core)
+    "inter_op_threads": 0,
+    "execution_mode": "sequential",  # or "parallel" (only helps graphs with independent branches)
+    "graph_optimization_level": "all",  # disable | basic | extended | all
+    "optimized_model_dir": None,    # cache optimised graphs here and load them on the next start
+}
+
+ORT_ENV = {
+    "providers": "ORT_PROVIDERS",  # comma-separated
+    "intra_op_threads": "ORT_INTRA_OP_THREADS",
+    "inter_op_threads": "ORT_INTER_OP_THREADS",
+    "execution_mode": "ORT_EXECUTION_MODE",
+    "graph_optimization_level": "ORT_GRAPH_OPT_LEVEL",
+    "optimized_model_dir": "ORT_OPTIMIZED_MODEL_DIR",
+}
+
+GRAPH_OPT_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+# Model class of each module; the session is built here, not by ModelRouter,
+# so it can come from a cached optimised graph
+MODEL_CLASSES = {
+    "detection": RetinaFace,
+    "recognition": ArcFaceONNX,
+    "genderage": Attribute,
+    "landmark_2d_106": Landmark,
+    "landmark_3d_68": Landmark,
+}
+
+
+def ort_config_from_env():
+    """ONNX Runtime settings from ORT_CONFIG (a JSON file) and the ORT_* variables.
+
+    serve.py sets ORT_INTRA_OP_THREADS so that workers x threads matches
+    the cores; ort_tuning_benchmark.py finds the best values for a host.
+    """
+    config = dict(ORT_DEFAULTS)
+    path = os.environ.get("ORT_CONFIG")
+    if path:
+        with open(path, "r") as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(ORT_DEFAULTS)
+        if unknown:
+            raise ValueError(f"{path}: unknown ONNX Runtime settings {sorted(unknown)}")
+        config.update(overrides)
+
+    for key, var in ORT_ENV.items():
+        value = os.environ.get(var)
+        if value:
+            config[key] = value
+    return normalize_ort_config(config)
+
+
+def normalize_ort_config(config):
+    config = {**ORT_DEFAULTS, **config}
+    providers = config["providers"]
+    if isinstance(providers, str):
+        providers = [p.strip() for p in providers.split(",") if p.strip()]
+    config["providers"] = providers or None
+    config["intra_op_threads"] = int(config["intra_op_threads"] or 0)
+    config["inter_op_threads"] = int(config["inter_op_threads"] or 0)
+    if config["execution_mode"] not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution_mode {config['execution_mode']!r}, "
+                         f"expected one of {', '.join(EXECUTION_MODES)}")
+    if config["graph_optimization_level"] not in GRAPH_OPT_LEVELS:
+        raise ValueError(f"Unknown graph_optimization_level {config['graph_optimization_level']!r}, "
+                         f"expected one of {', '.join(GRAPH_OPT_LEVELS)}")
+    return config
+
+
+def resolve_providers(config):
+    """Configured providers that this onnxruntime build has, in order."""
+    wanted = config["providers"] or get_default_providers()
+    available = onnxruntime.get_available_providers()
+    providers = [p for p in wanted if p in available]
+    if not providers:
+        raise ValueError(f"None of the execution providers {wanted} is available "
+                         f"(this onnxruntime has {available})")
+    return providers
+
+
+def session_options(config, graph_optimization_level=None, optimized_model_path=None):
+    """A fresh SessionOptions per session (they are not shared between sessions)."""
+    sess_options = onnxruntime.SessionOptions()
+    if config["intra_op_threads"]:
+        sess_options.intra_op_num_threads = config["intra_op_threads"]
+    if config["inter_op_threads"]:
+        sess_options.inter_op_num_threads = config["inter_op_threads"]
+    sess_options.execution_mode = EXECUTION_MODES[config["execution_mode"]]
+    sess_options.graph_optimization_level = GRAPH_OPT_LEVELS[
+        graph_optimization_level or config["graph_optimization_level"]
+    ]
+    if optimized_model_path:
+        sess_options.optimized_model_filepath = optimized_model_path
+    return sess_options
+
+
+def _cpu_id():
+    # Short id of the CPU model and its feature flags; Linux exposes them in
+    # /proc/cpuinfo, elsewhere platform.processor() is the best there is
+    fields = []
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() in ("model name", "flags", "Features", "CPU part"):
+                    fields.append(value.strip())
+                elif not line.strip() and fields:
+                    break  # first processor is enough
+    except OSError:
+        fields.append(platform.processor())
+    digest = hashlib.blake2b("\n".join(fields).encode(), digest_size=4).hexdigest()
+    return f"{platform.machine().lower()}_{digest}"
+
+
+def _optimized_model_path(config, name, onnx_file, providers):
+    # Optimised graphs may use kernels specific to the provider, the ORT
+    # version and (at level "all", e.g. NCHWc layouts) the CPU, so all of
+    # those go in the name; machines sharing the directory never load each
+    # other's "all" graphs
+    stem = os.path.splitext(os.path.basename(onnx_file))[0]
+    level = config["graph_optimization_level"]
+    tag = "-".join(p.replace("ExecutionProvider", "").lower() for p in providers)
+    if level == "all":
+        tag = f"{tag}-{_cpu_id()}"
+    filename = f"{name}-{stem}-{level}-{tag}-ort{onnxruntime.__version__}.onnx"
+    return os.path.join(os.path.expanduser(config["optimized_model_dir"]), filename)
+
+
+def create_session(config, onnx_file, name="buffalo_l"):
+    """InferenceSession for one model file, using the optimised-graph cache if enabled."""
+    providers = resolve_providers(config)
+    kwargs = {"providers": providers, "provider_options": get_default_provider_options()}
+    if not config["optimized_model_dir"] or config["graph_optimization_level"] == "disable":
+        return PickableInferenceSession(onnx_file, sess_options=session_options(config), **kwargs)
+
+    cached = _optimized_model_path(config, name, onnx_file, providers)
+    if os.path.exists(cached):
+        # Already optimised: skip the optimisation passes at load
+        return PickableInferenceSession(cached, sess_options=session_options(config, "disable"), **kwargs)
+
+    # Optimise now and save the result; the temp name + rename keeps other
+    # workers starting at the same time from reading a half-written file
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    tmp_path = f"{cached}.tmp-{os.getpid()}"
+    session = PickableInferenceSession(
+        onnx_file, sess_options=session_options(config, optimized_model_path=tmp_path), **kwargs
+    )
+    if os.path.exists(tmp_path):
+        os.replace(tmp_path, cached)
+    return session
+
+
+def load_face_app(profile="embed", name="buffalo_l", root="~/.insightface",
+                  ctx_id=0, det_size=(640, 640), verbose=True, ort_config=None):
+    """Build a prepared FaceAnalysis that only loads the modules of `profile`.
+
+    FaceAnalysis(allowed_modules=...) still creates an ONNX session for every
+    file in the pack and then throws the unwanted ones away, so this loads the
+    profile's files directly instead. Sessions follow `ort_config` (default:
+    ort_config_from_env()). Per-module load times (ms) are kept in
+    face_app.load_times.
+
+    The device comes from the configured providers. ctx_id=-1 is only needed
+    to force CPU on a GPU build: insightface then rebuilds every session
+    with the CPU provider, which doubles the load time.
+    """
+    config = normalize_ort_config(ort_config) if ort_config is not None else ort_config_from_env()
+    modules = PROFILES[profile]
+    model_dir = ensure_available("models", name, root=root)
+
+    face_app = FaceAnalysis.__new__(FaceAnalysis)
+    face_app.model_dir = model_dir
+    face_app.models = {}
+    face_app.load_times = {}
+    face_app.ort_config = config
+
+    for task in modules:
+        onnx_file = os.path.join(model_dir, BUFFALO_L_FILES[task])
+        start = time.perf_counter()
+        session = create_session(config, onnx_file, name)
+        model = MODEL_CLASSES[task](model_file=onnx_file, session=session)
+        face_app.load_times[task] = (time.perf_counter() - start) * 1000.0
+        if model.taskname != task:
+            raise ValueError(f"{onnx_file} is a {model.taskname!r} model, expected {task!r}")
+        face_app.models[task] = model
+
+    face_app.det_model = face_app.models["detection"]
+    face_app.prepare(ctx_id=ctx_id, det_size=det_size)
+
+    if verbose:
+        parts = ", ".join(f"{task} {ms:.0f} ms" for task, ms in face_app.load_times.items())
+        total = sum(face_app.load_times.values())
+        providers = face_app.det_model.session.get_providers()
+        print(f"✅ Loaded {name} '{profile}' profile in {total:.0f} ms ({parts}) on {', '.join(providers)}")
+    return face_app
+
+
+def time_modules(face_app, img, repeats=5):
+    """Average per-call latency (ms) of each loaded module on one image."""
+    timings = {}
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        faces = face_app.get(img)
+    timings["total"] = (time.perf_counter() - start) * 1000.0 / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        face_app.det_model.detect(img, max_num=0, metric="default")
+    timings["detection"] = (time.perf_counter() - start) * 1000.0 / repeats
+
+    for task, model in face_app.models.items():
+        if task == "detection":
+            continue
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for face in faces:
+                model.get(img, face)
+        timings[task] = (time.perf_counter() - start) * 1000.0 / repeats
+
+    return timings, len(faces)
+
+
+# Report load time and per-call cost of every module, and what a profile saves
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FaceAnalysis model profile report")
+    parser.add_argument("--image", required=True, help="Image to time per-call latency on")
+    parser.add_argument("--profile", default="embed", choices=PROFILES.keys())
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image)
+    if img is None:
+        raise SystemExit(f"❌ Could not read {args.image}")
+
+    full_app = load_face_app("full")
+    timings, n_faces = time_modules(full_app, img, repeats=args.repeats)
+    kept = PROFILES[args.profile]
+
+    print(f"\n{'module':<18}{'load ms':>10}{'call ms':>10}  in '{args.profile}'")
+    for task in PROFILES["full"]:
+        print(f"{task:<18}{full_app.load_times[task]:>10.1f}{timings[task]:>10.1f}  "
+              f"{'yes' if task in kept else 'no'}")
+
+    load_saved = sum(ms for task, ms in full_app.load_times.items() if task not in kept)
+    call_saved = sum(timings[task] for task in PROFILES["full"] if task not in kept)
+    print(f"\n🧠 {n_faces} faces, full get() = {timings['total']:.1f} ms per call")
+    print(f"⏱️ '{args.profile}' saves {load_saved:.0f} ms at startup "
+          f"and ~{call_saved:.1f} ms per call")
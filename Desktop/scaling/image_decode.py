@@ -0,0 +1,144 @@
+import struct
+import time
+import numpy as np
+import cv2
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+# JPEG start-of-frame markers carry the image dimensions (C4/C8/CC are not SOFs)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                     0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_size(data):
+    """Return (width, height) from a PNG/JPEG header without decoding, or None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # end of image / start of scan before any SOF
+            return None
+        seg_len = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + seg_len
+    return None
+
+
+def _check_limits(data, max_bytes, max_pixels):
+    # Returns the header size (or None) after rejecting oversized uploads
+    if max_bytes and len(data) > max_bytes:
+        raise ImageTooLarge(f"Upload is {len(data)} bytes, limit is {max_bytes}.")
+
+    size = read_image_size(data)
+    if max_pixels and size and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image is {size[0]}x{size[1]}, limit is {max_pixels} pixels.")
+    return size
+
+
+def _check_decoded(img, max_pixels):
+    # Formats we can't read the header of are checked after decoding
+    if img is not None and max_pixels and img.shape[0] * img.shape[1] > max_pixels:
+        raise ImageTooLarge(f"Image is {img.shape[1]}x{img.shape[0]}, limit is {max_pixels} pixels.")
+
+
+def decode_image(data, max_bytes=None, max_pixels=None):
+    """Decode uploaded image bytes straight into a BGR array (no temp file).
+
+    Returns None if the bytes are not a readable image. Raises ImageTooLarge
+    when the upload exceeds max_bytes, or its header reports more than
+    max_pixels, so oversized uploads are rejected before the expensive decode.
+    """
+    _check_limits(data, max_bytes, max_pixels)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    _check_decoded(img, max_pixels)
+    return img
+
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 size (DCT scaling)
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def decode_downscaled(data, max_side, max_bytes=None, max_pixels=None):
+    """Decode an upload so its long side is at most max_side pixels.
+
+    JPEGs whose header size is known are decoded at the largest reduced
+    size that is still >= max_side, then resized the rest of the way.
+    Returns (img, scale, reduction) where scale = working / original size
+    (divide coordinates by it to map back) and reduction is the JPEG
+    decode factor used (1 = full-size decode). img is None if unreadable.
+    """
+    size = _check_limits(data, max_bytes, max_pixels)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None, 1.0, 1
+
+    flag, reduction = cv2.IMREAD_COLOR, 1
+    if max_side and size and data[:2] == b"\xff\xd8":
+        long_side = max(size)
+        for factor, reduced_flag in _REDUCED_FLAGS:
+            if long_side // factor >= max_side:
+                flag, reduction = reduced_flag, factor
+                break
+
+    img = cv2.imdecode(buf, flag)
+    if img is None:
+        return None, 1.0, reduction
+    if reduction == 1:
+        _check_decoded(img, max_pixels)
+
+    # Decoded size of the original (orientation may have been applied)
+    orig_long = max(size) if size else max(img.shape[:2])
+
+    long_side = max(img.shape[:2])
+    if max_side and long_side > max_side:
+        ratio = max_side / long_side
+        img = cv2.resize(img, (max(1, round(img.shape[1] * ratio)), max(1, round(img.shape[0] * ratio))),
+                         interpolation=cv2.INTER_AREA)
+
+    return img, max(img.shape[:2]) / orig_long, reduction
+
+
+def measure_decode_rate(width=1920, height=1440, repeats=3):
+    """Full-size JPEG decode cost on this host, in ms per megapixel."""
+    # Smooth gradient + noise so the encoded size is photo-like
+    rng = np.random.default_rng(0)
+    xx, yy = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    img = np.dstack([xx, yy, (xx + yy) / 2]) + rng.normal(0, 12, (height, width, 3))
+    ok, encoded = cv2.imencode(".jpg", np.clip(img, 0, 255).astype(np.uint8))
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0 / repeats
+    return elapsed_ms / (width * height / 1e6)
@@ -0,0 +1,152 @@
+# Binary, memory-mappable index bundle written by cluster_faces.py.
+#
+# index_bundle/
+#   meta.json              format version, counts, embedding dim
+#   rep_embeddings.npy     float32 (n_clusters, dim), L2-normalised (cluster centroids)
+#   rep_labels.npy         int64   (n_clusters,)  DBSCAN label of each row
+#   person_indptr.npy      int64   (n_clusters + 1,)  CSR row pointers ...
+#   person_photos.npy      int32   (nnz,)             ... into photo_names
+#   photo_names.npy        bytes   (n_photos,)  UTF-8 filenames
+#   photo_drive_ids.npy    bytes   (n_photos,)  Drive file ids ('' = unknown), optional
+#   face_embeddings.npy    float32 (n_faces, dim), L2-normalised
+#   face_labels.npy        int64   (n_faces,)
+#   face_photos.npy        int32   (n_faces,)  photo of each face
+#   proto_indptr.npy       int64   (n_clusters + 1,)  CSR row pointers ...
+#   proto_embeddings.npy   float32 (n_protos, dim)    ... of medoid prototypes (optional)
+#
+# Face row i of the face_* arrays is entry i of processed_data.pkl;
+# ann_index/, embedding_store/ and photo_index/ use the same face rows.
+#
+# The API opens every array with np.load(mmap_mode="r"), so startup does not
+# parse anything proportional to the event size and all workers share the
+# same page-cache pages.
+import os
+import json
+import time
+import shutil
+import pickle
+import numpy as np
+from matcher import normalize_rows
+
+BUNDLE_DIR = "index_bundle"
+FORMAT_VERSION = 1
+
+
+def write_bundle(path, face_data, labels, rep_labels, rep_embeddings, filename_to_drive_id=None,
+                 prototypes=None):
+    """Write a bundle for one clustering run; replaces `path` atomically.
+
+    prototypes: optional (proto_indptr, proto_embeddings) from
+    prototypes.cluster_prototypes, rows in rep_labels order.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    rep_labels = np.asarray(rep_labels, dtype=np.int64)
+
+    photo_names = sorted({entry["filename"] for entry in face_data})
+    photo_ids = {name: i for i, name in enumerate(photo_names)}
+    face_photos = np.array([photo_ids[entry["filename"]] for entry in face_data], dtype=np.int32)
+
+    # CSR person -> photos, rows in rep_labels order
+    row_of_label = {int(label): row for row, label in enumerate(rep_labels)}
+    rows = [set() for _ in rep_labels]
+    for label, photo in zip(labels, face_photos):
+        rows[row_of_label[int(label)]].add(int(photo))
+    person_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    person_indptr[1:] = np.cumsum([len(r) for r in rows])
+    person_photos = np.array([p for r in rows for p in sorted(r)], dtype=np.int32)
+
+    dim = int(np.asarray(rep_embeddings).shape[-1]) if len(rep_labels) else 0
+    arrays = {
+        "rep_embeddings": normalize_rows(np.asarray(rep_embeddings, dtype=np.float32).reshape(len(rep_labels), dim)),
+        "rep_labels": rep_labels,
+        "person_indptr": person_indptr,
+        "person_photos": person_photos,
+        "photo_names": np.array([n.encode() for n in photo_names], dtype=np.bytes_),
+        "face_embeddings": normalize_rows(np.array([e["embedding"] for e in face_data], dtype=np.float32).reshape(len(face_data), dim)),
+        "face_labels": labels,
+        "face_photos": face_photos,
+    }
+    if prototypes is not None:
+        arrays["proto_indptr"] = np.asarray(prototypes[0], dtype=np.int64)
+        arrays["proto_embeddings"] = normalize_rows(np.asarray(prototypes[1], dtype=np.float32))
+    if filename_to_drive_id is not None:
+        arrays["photo_drive_ids"] = np.array(
+            [filename_to_drive_id.get(n, "").encode() for n in photo_names], dtype=np.bytes_
+        )
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dim": dim,
+        "n_clusters": len(rep_labels),
+        "n_photos": len(photo_names),
+        "n_faces": len(face_data),
+        "n_prototypes": len(arrays["proto_embeddings"]) if prototypes is not None else 0,
+        "arrays": sorted(arrays),
+    }
+
+    return write_array_dir(path, arrays, meta)
+
+
+def write_array_dir(path, arrays, meta, write_files=None):
+    """Write <name>.npy per array plus meta.json; replaces `path` atomically.
+
+    write_files(tmp_path), if given, adds files that are not arrays (the
+    hnswlib graph). Returns meta.
+    """
+    # Build next to the target, then swap, so readers never see a half-written directory
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+    if write_files is not None:
+        write_files(tmp_path)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    replace_dir(tmp_path, path)
+    return meta
+
+
+def replace_dir(tmp_path, path):
+    """Move a freshly written directory into place, replacing any old one."""
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_face_embeddings(source):
+    """Face embeddings of a bundle directory (memory-mapped) or a processed_data.pkl."""
+    if os.path.isdir(source):
+        return IndexBundle(source).face_embeddings
+    with open(source, "rb") as f:
+        return np.array([entry["embedding"] for entry in pickle.load(f)], dtype=np.float32)
+
+
+class IndexBundle:
+    """Read-only, memory-mapped view of a bundle directory."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported bundle format {self.meta.get('format_version')!r}, "
+                             f"expected {FORMAT_VERSION}")
+        self.path = path
+        for name in self.meta["arrays"]:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        for name in ("photo_drive_ids", "proto_indptr", "proto_embeddings"):
+            if not hasattr(self, name):
+                setattr(self, name, None)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def person_photo_ids(self, row):
+        return self.person_photos[self.person_indptr[row]:self.person_indptr[row + 1]]
+
+    def photo_name(self, photo_id):
+        return self.photo_names[photo_id].decode()
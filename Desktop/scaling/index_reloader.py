@@ -0,0 +1,127 @@
+import os
+import time
+import functools
+import asyncio
+import logging
+from event_index import EventIndex
+from index_bundle import BUNDLE_DIR
+from ann_index import ANN_DIR
+from embedding_store import STORE_DIR
+from photo_index import PHOTO_INDEX_DIR
+
+logger = logging.getLogger("index_reloader")
+
+# Files EventIndex.load reads, bundle first
+WATCHED_FILES = (
+    os.path.join(BUNDLE_DIR, "meta.json"),
+    os.path.join(ANN_DIR, "meta.json"),
+    os.path.join(STORE_DIR, "meta.json"),
+    os.path.join(PHOTO_INDEX_DIR, "meta.json"),
+    "cluster_representatives.pkl",
+    "person_to_photos.json",
+    "drive_file_map.json",
+)
+
+
+def index_signature(directory):
+    """(path, mtime, size) of every index file present; changes on re-clustering."""
+    signature = []
+    for name in WATCHED_FILES:
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        signature.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+class IndexReloader:
+    """Holds the live EventIndex and swaps in a rebuilt one on demand.
+
+    Requests read `current` once and use that snapshot to the end, so a swap
+    never changes the index under a request in flight; the old one is freed
+    when its last request finishes. The new index is built in a thread, off
+    the event loop, and swapped in with a single assignment. `generation`
+    increases with every swap (for cache keys and /ready).
+    """
+
+    def __init__(self, directory=".", on_swap=None, generation=0, **load_options):
+        self.directory = directory
+        self.on_swap = on_swap  # called with the new index after each swap
+        self.load_options = load_options  # passed on to EventIndex.load
+        self.signature = index_signature(directory)
+        self.current = EventIndex.load(directory, **load_options)
+        self.current.generation = generation
+        self.generation = generation
+        self.loaded_at = time.time()
+        self.last_error = None
+        self._lock = asyncio.Lock()
+        self._pending = None
+
+    async def reload(self):
+        """Build a new index from disk and swap it in. Returns its stats.
+
+        Concurrent calls are serialised; a failed build leaves the current
+        index in place and re-raises.
+        """
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            signature = index_signature(self.directory)
+            start = time.perf_counter()
+            try:
+                index = await loop.run_in_executor(
+                    None, functools.partial(EventIndex.load, self.directory, **self.load_options)
+                )
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("❌ Index reload failed; keeping generation %d", self.generation)
+                raise
+
+            index.generation = self.generation + 1
+            self.current = index
+            self.generation = index.generation
+            self.signature = signature
+            self.loaded_at = time.time()
+            self.last_error = None
+            if self.on_swap is not None:
+                self.on_swap(index)
+
+            load_ms = (time.perf_counter() - start) * 1000.0
+            logger.info("🔄 Index generation %d loaded in %.0f ms (%d clusters)",
+                        self.generation, load_ms, len(index.person_ids))
+            return {**self.stats(), "load_ms": round(load_ms, 1)}
+
+    async def watch(self, interval=5.0):
+        """Reload whenever the index files change on disk."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.poll()
+
+    async def poll(self):
+        """One watch tick: reload if the files changed and have settled.
+
+        cluster_faces.py rewrites the pickle/JSON files one after another, so
+        a change is only picked up once the files have stayed the same for
+        one full interval (two consecutive polls).
+        """
+        signature = index_signature(self.directory)
+        if signature == self.signature:
+            self._pending = None
+            return
+        if signature != self._pending:
+            self._pending = signature  # still being written; check again next tick
+            return
+        self._pending = None
+        try:
+            await self.reload()
+        except Exception:
+            # Keep serving the old index; retried when the files change again
+            self.signature = signature
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "clusters": len(self.current.person_ids),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,54 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class InferencePool:
+    """Runs blocking model work off the asyncio event loop.
+
+    kind="thread" shares one model between threads (ONNX Runtime releases the
+    GIL during inference); kind="process" gives every worker its own model,
+    loaded by `initializer`. At most workers + queue_size jobs are handed to
+    the executor at once; further callers wait here, so the executor's own
+    queue never grows without bound.
+    """
+
+    def __init__(self, kind="thread", workers=None, queue_size=None, initializer=None):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 2 if queue_size is None else queue_size
+
+        if kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                               thread_name_prefix="inference")
+        elif kind == "process":
+            # spawn, not fork: ONNX Runtime sessions are not fork-safe
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=initializer)
+        else:
+            raise ValueError(f"Unknown inference pool kind: {kind!r} (use 'thread' or 'process')")
+
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        self.pending = 0
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool and await its result."""
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, fn, *args)
+            finally:
+                self.pending -= 1
+
+    async def run_local(self, fn, *args):
+        """Run fn(*args) against this process's state (e.g. the match index)."""
+        if self.kind == "thread":
+            return await self.run(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+# Load generator for the match endpoint (stdlib only).
+#
+#   uvicorn main:app --port 8000            # or: python serve.py --workers 4
+#   python load_test.py --concurrency 16 --duration 60
+#   python load_test.py --rate 20 --duration 60 --output runs/rate20.json
+#
+# Replays a folder of selfies against /api/v1/get-similar-photos, either with
+# a fixed number of clients in a loop (--concurrency) or at a fixed arrival
+# rate (--rate, open loop: latency is measured from each request's scheduled
+# send time, so a stalled server shows up as latency instead of being hidden
+# by clients that wait before sending the next request). Prints throughput,
+# p50/p95/p99 latency and error rate and saves them as JSON for comparing
+# server changes across runs.
+import os
+import json
+import glob
+import time
+import uuid
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_IMAGES = os.path.join("..", "benchmark", "images", "*_face.*")
+ENDPOINT = "/api/v1/get-similar-photos"
+
+
+def encode_multipart(fields, file_field, filename, file_bytes):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode() + file_bytes + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def load_images(pattern):
+    paths = sorted(glob.glob(pattern))
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def send_request(url, i, image, mode="single", cache_bust=True, timeout=120):
+    """POST one selfie -> {"status", "latency_s", "error"}; never raises.
+
+    With cache_bust a few random bytes are appended after the image data
+    (decoders ignore them), so the server's repeat-upload cache never hits.
+    """
+    filename, data = image
+    if cache_bust:
+        data = data + uuid.uuid4().bytes
+    body, content_type = encode_multipart(
+        {"request_id": f"load-{i}", "name": "load", "phone_number": "0", "mode": mode},
+        "image", filename, data,
+    )
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            r.read()
+            status, error = r.status, None
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, error = e.code, None
+    except (urllib.error.URLError, OSError) as e:
+        status, error = 0, str(getattr(e, "reason", e))
+    return {"status": status, "latency_s": time.perf_counter() - start, "error": error}
+
+
+def run_concurrency(url, images, concurrency, n_requests=None, duration=None, **kwargs):
+    """Closed loop: `concurrency` clients, each sending back-to-back."""
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(10 ** 12))
+    deadline = time.perf_counter() + duration if duration else None
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter)
+            if (n_requests is not None and i >= n_requests) or (deadline and time.perf_counter() >= deadline):
+                return
+            result = send_request(url, i, images[i % len(images)], **kwargs)
+            with lock:
+                results.append(result)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+
+def run_rate(url, images, rate, n_requests=None, duration=None, max_in_flight=256, **kwargs):
+    """Open loop: one request every 1/rate s, whatever the server does."""
+    n_requests = n_requests if n_requests is not None else int(rate * duration)
+    start = time.perf_counter()
+
+    def scheduled(i):
+        result = send_request(url, i, images[i % len(images)], **kwargs)
+        # Count the time spent waiting for a free client thread as latency
+        result["latency_s"] = time.perf_counter() - (start + i / rate)
+        return result
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for i in range(n_requests):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(scheduled, i))
+        results = [f.result() for f in futures]
+    return results, time.perf_counter() - start
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(results, duration):
+    """Throughput, latency percentiles (ms, successful requests) and errors."""
+    ok = sorted(r["latency_s"] for r in results if r["status"] == 200)
+    statuses = Counter(str(r["status"]) for r in results)
+    n_errors = len(results) - len(ok)
+
+    def ms(value):
+        return round(value * 1000.0, 1) if value is not None else None
+
+    return {
+        "requests": len(results),
+        "successes": len(ok),
+        "errors": n_errors,
+        "error_rate": round(n_errors / len(results), 4) if results else 0.0,
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else 0.0,
+        "offered_rps": round(len(results) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": ms(sum(ok) / len(ok)) if ok else None,
+            "p50": ms(percentile(ok, 50)),
+            "p95": ms(percentile(ok, 95)),
+            "p99": ms(percentile(ok, 99)),
+            "max": ms(ok[-1]) if ok else None,
+        },
+        "status_counts": dict(statuses),
+        "sample_errors": sorted({r["error"] for r in results if r["error"]})[:5],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /api/v1/get-similar-photos")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Glob of selfies to replay")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=8, help="Closed loop: parallel clients")
+    load.add_argument("--rate", type=float, help="Open loop: requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="Total requests instead of a duration")
+    parser.add_argument("--warmup", type=int, default=0, help="Requests to send (and discard) first")
+    parser.add_argument("--mode", default="single", choices=["single", "group"])
+    parser.add_argument("--reuse-bytes", action="store_true",
+                        help="Send identical bytes per image, so the server's result cache can hit")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Client threads for --rate")
+    parser.add_argument("--output", default=f"load_test_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--label", default="", help="Free-form note stored in the JSON (e.g. the change tested)")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"❌ No images match {args.images}")
+    url = args.url.rstrip("/") + ENDPOINT
+    kwargs = {"mode": args.mode, "cache_bust": not args.reuse_bytes}
+    duration = None if args.requests else args.duration
+
+    if args.warmup:
+        run_concurrency(url, images, min(args.warmup, args.concurrency or 8), n_requests=args.warmup, **kwargs)
+
+    shape = f"{args.rate} req/s" if args.rate else f"{args.concurrency} clients"
+    print(f"🚀 {shape} against {url} with {len(images)} images...")
+    if args.rate:
+        results, elapsed = run_rate(url, images, args.rate, args.requests, duration,
+                                    max_in_flight=args.max_in_flight, **kwargs)
+    else:
+        results, elapsed = run_concurrency(url, images, args.concurrency, args.requests, duration, **kwargs)
+
+    summary = summarize(results, elapsed)
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "url": url,
+        "images": [name for name, _ in images],
+        "load": {"rate": args.rate, "concurrency": None if args.rate else args.concurrency,
+                 "duration": duration, "requests": args.requests, "mode": args.mode,
+                 "cache_bust": not args.reuse_bytes},
+        "summary": summary,
+    }
+
+    lat = summary["latency_ms"]
+    print(f"   {summary['successes']}/{summary['requests']} ok, {summary['throughput_rps']} req/s, "
+          f"p50 {lat['p50']} ms, p95 {lat['p95']} ms, p99 {lat['p99']} ms, "
+          f"errors {summary['error_rate']:.1%} {summary['status_counts']}")
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Done! 📁 Results saved to: {args.output}")
@@ -94,40 +94,218 @@
 # if __name__ == "__main__":
 #     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Query, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import pickle
+import asyncio
 import json
 import os
+import time
+from typing import List
+import logging
 import numpy as np
-import cv2
-from insightface.app import FaceAnalysis
-from sklearn.metrics.pairwise import cosine_similarity
-
-# ---------- Initialize Face Analysis ----------
-face_app = FaceAnalysis(name="buffalo_l")
-face_app.prepare(ctx_id=0)  # use -1 for CPU, 0 for GPU
-
-# ---------- Load Clustering and Mapping Data ----------
-with open("cluster_representatives.pkl", "rb") as f:
-    cluster_embeddings = pickle.load(f)
+from event_index import decode_cursor
+from event_registry import EventRegistry, UnknownEvent
+from image_decode import ImageTooLarge
+from inference_pool import InferencePool
+from admission import AdmissionGate, Overloaded
+from batcher import MicroBatcher
+from result_cache import ResultCache, upload_key, result_variant
+from bulk_match import match_record
+from metrics import Registry, StageTimer, FACE_COUNT_BUCKETS
+import pipeline
+from pipeline import UnreadableImage, NoFaceDetected
+
+# ---------- Upload Limits (0 = no limit) ----------
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 0))
+MAX_UPLOAD_PIXELS = int(os.environ.get("MAX_UPLOAD_PIXELS", 0))
+
+# ---------- Working Resolution ----------
+# Uploads are decoded/downscaled so the long side is at most this many pixels
+# before detection (0 = keep original). Detection runs at 640x640 anyway.
+WORKING_MAX_SIDE = int(os.environ.get("WORKING_MAX_SIDE", 1280))
+
+DECODE_LIMITS = {
+    "max_bytes": MAX_UPLOAD_BYTES,
+    "max_pixels": MAX_UPLOAD_PIXELS,
+    "max_side": WORKING_MAX_SIDE,
+}
+
+logging.basicConfig(level=logging.INFO)
+
+# ---------- Inference Pool ----------
+# INFERENCE_POOL=thread shares one model across threads, =process loads one per worker
+INFERENCE_POOL = os.environ.get("INFERENCE_POOL", "thread")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0)) or None  # default: CPU count
+INFERENCE_QUEUE_SIZE = os.environ.get("INFERENCE_QUEUE_SIZE")  # default: 2 x workers
+
+inference_pool = InferencePool(
+    kind=INFERENCE_POOL,
+    workers=INFERENCE_WORKERS,
+    queue_size=int(INFERENCE_QUEUE_SIZE) if INFERENCE_QUEUE_SIZE else None,
+    initializer=pipeline.init_worker,
+)
 
-with open("person_to_photos.json", "r") as f:
-    person_to_photos = json.load(f)
+# ---------- Admission Control ----------
+# At most ADMISSION_LIMIT requests run inference at once; up to
+# ADMISSION_QUEUE more wait, each for at most ADMISSION_MAX_WAIT_MS. The rest
+# get a fast 503 with Retry-After instead of piling up until clients time out.
+admission = AdmissionGate(
+    limit=int(os.environ.get("ADMISSION_LIMIT", 0)) or inference_pool.workers * 2,
+    max_queue=int(os.environ.get("ADMISSION_QUEUE", 64)),
+    max_wait_ms=float(os.environ.get("ADMISSION_MAX_WAIT_MS", 5000)),
+)
+# How often a running request checks whether its client is still there
+DISCONNECT_POLL_S = float(os.environ.get("DISCONNECT_POLL_MS", 100)) / 1000.0
+
+# ---------- Recognition Micro-Batching ----------
+# Aligned crops from concurrent requests are embedded together in one call
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+BATCH_MAX_QUEUE = int(os.environ.get("BATCH_MAX_QUEUE", 256))
+
+async def embed_batch(crops):
+    return await inference_pool.run(pipeline.embed_crops, crops)
+
+embed_batcher = MicroBatcher(
+    embed_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue=BATCH_MAX_QUEUE,
+)
 
-with open("drive_file_map.json", "r") as f:
-    filename_to_drive_id = json.load(f)
+# ---------- Match Selection ----------
+# Return photos of up to MATCH_TOP_K clusters scoring >= MATCH_MIN_SIMILARITY
+# (merged, de-duplicated). Defaults keep the single best cluster, always.
+MATCH_TOP_K = int(os.environ.get("MATCH_TOP_K", 1))
+MATCH_MIN_SIMILARITY = os.environ.get("MATCH_MIN_SIMILARITY")
+MATCH_MIN_SIMILARITY = float(MATCH_MIN_SIMILARITY) if MATCH_MIN_SIMILARITY else None
+
+# ---------- Group-Photo Mode ----------
+# mode=group matches every detected face (up to this many) instead of the first
+MAX_GROUP_FACES = int(os.environ.get("MAX_GROUP_FACES", 20))
+QUERY_MODES = ("single", "group")
+
+# ---------- Face -> Photo Retrieval ----------
+# retrieval=faces skips the clusters: the query is matched against every
+# stored face and photos are returned ranked by their best face scoring
+# >= PHOTO_MIN_SIMILARITY (all of them; page_size does not apply).
+# RETRIEVAL_MODE sets the default for requests that don't say.
+RETRIEVAL_MODES = ("clusters", "faces")
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "clusters")
+PHOTO_MIN_SIMILARITY = float(os.environ.get("PHOTO_MIN_SIMILARITY", 0.5))
+
+# ---------- Result Pagination ----------
+# >0: the match response holds only the first page of photos plus a cursor for
+# /api/v1/similar-photos/{face_id}; 0 returns every photo (what v2.HTML expects)
+RESULTS_PAGE_SIZE = int(os.environ.get("RESULTS_PAGE_SIZE", 0))
+MAX_PAGE_SIZE = 500
+
+# ---------- Repeat-Upload Cache ----------
+# Identical uploads (same bytes) reuse the embedding and match of the first one
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_ENTRIES", 1024)),
+    ttl_seconds=float(os.environ.get("RESULT_CACHE_TTL", 600)),
+    max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
 
-def get_drive_url(filename):
-    file_id = filename_to_drive_id.get(filename)
-    if file_id:
-        return f"https://lh3.googleusercontent.com/d/{file_id}=w600"
-    return None
+# ---------- Metrics (GET /metrics, Prometheus text format) ----------
+# Stages: event (lookup / lazy load), read, cache, admission, decode, detect,
+# pool_wait, recognize, score, urls (URL mapping + JSON rendering) and total.
+# Values are per process; under serve.py each scrape is answered by
+# whichever worker accepts it.
+metrics_registry = Registry()
+REQUESTS = metrics_registry.counter(
+    "match_requests_total", "Match requests by query mode and HTTP status.", ("mode", "status"))
+ERRORS = metrics_registry.counter(
+    "match_errors_total", "Failed match requests by cause.", ("reason",))
+IN_FLIGHT = metrics_registry.gauge(
+    "match_requests_in_flight", "Match requests currently being processed.")
+STAGE_SECONDS = metrics_registry.histogram(
+    "match_stage_seconds", "Time a match request spends in each stage.", ("stage",))
+FACES_PER_QUERY = metrics_registry.histogram(
+    "match_faces_per_query", "Faces detected and matched per request.", buckets=FACE_COUNT_BUCKETS)
+
+# Mirrored from the index, batcher, pool and cache at scrape time
+INDEX_CLUSTERS = metrics_registry.gauge("index_clusters", "Clusters (people) in the live index.", ("event",))
+INDEX_GENERATION = metrics_registry.gauge("index_generation", "Reloads since startup.", ("event",))
+EVENTS_LOADED = metrics_registry.gauge("events_loaded", "Events whose index is loaded.")
+EVENTS_BYTES = metrics_registry.gauge("events_index_bytes", "Index files of the loaded events.")
+EVENT_LOADS = metrics_registry.counter("event_loads_total", "Lazy event index loads.")
+EVENT_EVICTIONS = metrics_registry.counter("event_evictions_total", "Events evicted under the memory budget.")
+POOL_PENDING = metrics_registry.gauge("inference_pool_pending", "Jobs running or queued in the inference pool.")
+BATCH_QUEUE = metrics_registry.gauge("embed_batcher_queue_depth", "Crops waiting for a recognition batch.")
+BATCHES = metrics_registry.counter("embed_batches_total", "Recognition batches run.")
+BATCHED_ITEMS = metrics_registry.counter("embed_batched_items_total", "Crops embedded through the batcher.")
+ADMISSION_ACTIVE = metrics_registry.gauge("admission_active", "Requests holding an inference slot.")
+ADMISSION_WAITING = metrics_registry.gauge("admission_waiting", "Requests queued for an inference slot.")
+CACHE_LOOKUPS = metrics_registry.counter("result_cache_lookups_total", "Result cache lookups.", ("result",))
+CACHE_ENTRIES = metrics_registry.gauge("result_cache_entries", "Entries in the result cache.")
+CACHE_BYTES = metrics_registry.gauge("result_cache_bytes", "Estimated size of the result cache.")
 
+# ---------- Initialize Face Analysis ----------
+# The model is loaded by the startup warmup (see warm_up below), not at
+# import time, so serve.py can fork workers after importing this module
+# without copying live ONNX Runtime thread pools into them.
 
-# https://lh3.googleusercontent.com/d/1RStarVhCtarEPNFTmBQdlfxWd8daSU_M=w800
+# ---------- Load Clustering and Mapping Data ----------
+# Matcher plus every person's Drive URL list, pre-serialised to JSON. Uses the
+# memory-mapped index_bundle/ from cluster_faces.py when present.
+# Handlers take the event's reloader.current once per request; a reload
+# swaps in a new index without touching requests that are still running.
+# Requests without an event_id use INDEX_DIR ("" = none, event_id required).
+INDEX_DIR = os.environ.get("INDEX_DIR", ".")
+INDEX_WATCH_INTERVAL = float(os.environ.get("INDEX_WATCH_INTERVAL", 0))  # seconds, 0 = off
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # required by /api/v1/admin/*
+
+# ---------- Multi-Event Registry ----------
+# event_id=<id> matches against EVENTS_ROOT/<id>/ (one cluster_faces.py
+# output per event), loaded on first use. The least recently used events are
+# dropped once the loaded index files exceed EVENTS_MEMORY_BUDGET_MB or
+# there are more than EVENTS_MAX_LOADED of them (0 = no limit).
+EVENTS_ROOT = os.environ.get("EVENTS_ROOT")
+EVENTS_MEMORY_BUDGET_MB = float(os.environ.get("EVENTS_MEMORY_BUDGET_MB", 0))
+EVENTS_MAX_LOADED = int(os.environ.get("EVENTS_MAX_LOADED", 0))
+
+def warm_matcher(index):
+    if ready:
+        index.matcher.matches(np.ones(index.matcher.dim, dtype=np.float32))
+
+def index_swapped(index):
+    # Cache keys carry the event and its generation, so results from the
+    # old index are never served after the swap; they age out of the LRU
+    # rather than being cleared, which would drop every other event's too
+    warm_matcher(index)
+
+# ---------- Match Index ----------
+# MATCH_INDEX=auto shortlists the PROTO_COARSE_K best cluster centroids and
+# re-ranks them by their medoid prototypes (bundles from cluster_faces.py
+# have them). Older bundles without prototypes fall back to the compact
+# codes in embedding_store/ (EMBEDDING_CODEC), then to ann_index/ (clusters
+# score as their best face among the ANN_SEARCH_K nearest), then to one
+# representative per cluster. =prototypes / =ann / =compressed / =clusters
+# forces one. ANN_NPROBE (IVF) / ANN_EF (HNSW): higher = better recall,
+# slower queries.
+INDEX_LOAD_OPTIONS = {
+    "match_index": os.environ.get("MATCH_INDEX", "auto"),
+    "ann_search_k": int(os.environ.get("ANN_SEARCH_K", 50)),
+    "ann_nprobe": int(os.environ.get("ANN_NPROBE", 16)),
+    "ann_ef": int(os.environ.get("ANN_EF", 64)),
+    "proto_coarse_k": int(os.environ.get("PROTO_COARSE_K", 32)),
+    # retrieval=faces: nearest faces fetched first (grows while they all match)
+    "photo_search_k": int(os.environ.get("PHOTO_SEARCH_K", 200)),
+}
+
+event_registry = EventRegistry(
+    events_root=EVENTS_ROOT,
+    default_dir=INDEX_DIR,
+    max_bytes=int(EVENTS_MEMORY_BUDGET_MB * 1024 * 1024),
+    max_events=EVENTS_MAX_LOADED,
+    on_swap=index_swapped,
+    on_load=warm_matcher,
+    **INDEX_LOAD_OPTIONS,
+)
 
 # ---------- FastAPI App ----------
 app = FastAPI(title="Face Photo Match API")
@@ -141,69 +319,421 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def match_response(index, request_id, matches, page_size):
+    if page_size > 0:
+        face_ids = [pid for pid, _ in matches]
+        body = index.render_page(request_id, face_ids, 0, min(page_size, MAX_PAGE_SIZE), matches)
+    else:
+        body = index.render_match(request_id, matches)
+    return Response(content=body, media_type="application/json")
+
+def group_response(index, request_id, faces, page_size):
+    body = index.render_group(request_id, faces, min(page_size, MAX_PAGE_SIZE))
+    return Response(content=body, media_type="application/json")
+
+# ---------- Warmup / Readiness ----------
+# /ready answers 503 until every model has run once, so a load balancer
+# never sends a guest to a cold worker
+ready = False
+
+async def warm_up():
+    global ready
+    batch_sizes = sorted({1, BATCH_MAX_SIZE})
+    # One warmup per worker; in process mode this also spawns every worker
+    n_warmups = inference_pool.workers if INFERENCE_POOL == "process" else 1
+    try:
+        await asyncio.gather(*[
+            inference_pool.run(pipeline.warmup, WORKING_MAX_SIDE, batch_sizes)
+            for _ in range(n_warmups)
+        ])
+        default = event_registry.loaded()
+        if default is not None:
+            default.current.matcher.matches(np.ones(default.current.matcher.dim, dtype=np.float32))
+    except Exception:
+        logging.exception("❌ Model warmup failed; /ready stays 503")
+        return
+    ready = True
+
+@app.on_event("startup")
+async def start_warmup():
+    app.state.warmup_task = asyncio.create_task(warm_up())
+    if INDEX_WATCH_INTERVAL > 0:
+        # With serve.py every worker watches (and reloads) on its own
+        app.state.index_watch_task = asyncio.create_task(event_registry.watch(INDEX_WATCH_INTERVAL))
+
+@app.get("/ready")
+async def readiness():
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    default = event_registry.loaded()
+    return {"status": "ready", "index_generation": default.generation if default is not None else None,
+            "events_loaded": event_registry.stats()["events_loaded"]}
+
+@app.on_event("shutdown")
+async def shutdown_inference_pool():
+    await embed_batcher.close()
+    inference_pool.shutdown()
+
 # ---------- POST Endpoint ----------
 @app.post("/api/v1/get-similar-photos")
 async def get_similar_photos(
+    request: Request,
     request_id: str = Form(...),
     name: str = Form(...),
     phone_number: str = Form(...),
-    image: UploadFile = File(...)
+    image: UploadFile = File(...),
+    page_size: int = Form(RESULTS_PAGE_SIZE),
+    mode: str = Form("single"),
+    event_id: str = Form(None),
+    retrieval: str = Form(RETRIEVAL_MODE)
 ):
+    start = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        response = await run_until_disconnect(
+            request, match_upload(request_id, image, page_size, mode, event_id, retrieval)
+        )
+        if response is None:
+            # Nobody is listening any more; 499 only shows up in the metrics
+            response = error_response(499, "client_disconnected", "Client disconnected.", request_id)
+    finally:
+        IN_FLIGHT.dec()
+    REQUESTS.inc(mode if mode in QUERY_MODES else "invalid", str(response.status_code))
+    STAGE_SECONDS.observe(time.perf_counter() - start, "total")
+    return response
+
+async def run_until_disconnect(request, coro):
+    """Await coro, cancelling it if the client disconnects first (-> None).
+
+    Cancelling drops the request's queued work: its admission wait, pool jobs
+    not yet started and its crop in the micro-batcher. A model call that is
+    already running finishes, but its result is discarded.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                return None
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+def error_response(status_code, reason, message, request_id):
+    ERRORS.inc(reason)
+    return JSONResponse(status_code=status_code, content={
+        "error": message,
+        "request_id": request_id
+    })
+
+async def match_upload(request_id, image, page_size, mode, event_id=None, retrieval="clusters"):
+    if mode not in QUERY_MODES:
+        return error_response(
+            400, "bad_mode", f"Unknown mode '{mode}', expected one of {', '.join(QUERY_MODES)}.", request_id
+        )
+    if retrieval not in RETRIEVAL_MODES:
+        return error_response(
+            400, "bad_retrieval",
+            f"Unknown retrieval '{retrieval}', expected one of {', '.join(RETRIEVAL_MODES)}.", request_id
+        )
+
+    timer = StageTimer(STAGE_SECONDS)
     try:
-        # Save uploaded image to disk
+        # Snapshot: this request matches and renders against one index even
+        # if a reload swaps in a new one (or the event is evicted) meanwhile
+        try:
+            reloader = await event_registry.get(event_id)
+        except UnknownEvent as e:
+            return error_response(404, "unknown_event", str(e), request_id)
+        index = reloader.current
+        timer.lap("event")
+        if retrieval == "faces" and index.photos is None:
+            return error_response(
+                400, "no_photo_index",
+                "This event has no face -> photo index (run preprocess_faces.py).", request_id
+            )
+
         contents = await image.read()
-        os.makedirs("temp_faces", exist_ok=True)
-        image_path = f"temp_faces/{request_id}.jpg"
-        with open(image_path, "wb") as f:
-            f.write(contents)
-
-        # Read and validate image
-        img = cv2.imread(image_path)
-        if img is None:
+        timer.lap("read")
+
+        # Same upload seen recently: skip decode, inference and matching
+        cache_key = upload_key(contents, result_variant(mode, retrieval, event_id, index.generation))
+        cached = result_cache.get(cache_key)
+        timer.lap("cache")
+        if cached is not None:
+            response = render_result(index, request_id, cached[1], page_size, mode, retrieval)
+            timer.lap("urls")
+            return response
+
+        # Bounded admission: only requests that need inference queue here
+        try:
+            async with admission.admit():
+                timer.lap("admission")
+                return await infer_and_match(
+                    index, timer, request_id, contents, cache_key, page_size, mode, retrieval
+                )
+        except Overloaded as e:
+            response = error_response(503, e.reason, str(e), request_id)
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+
+    except Exception as e:
+        logging.exception("❌ Match request %s failed", request_id)
+        return error_response(500, "internal", str(e), request_id)
+
+def render_result(index, request_id, result, page_size, mode, retrieval):
+    # result: matches / photo hits for one face, or the per-face list in group mode
+    if retrieval == "faces":
+        if mode == "group":
+            body = index.render_group_photos(request_id, result)
+        else:
+            body = index.render_photos(request_id, result)
+        return Response(content=body, media_type="application/json")
+    if mode == "group":
+        return group_response(index, request_id, result, page_size)
+    return match_response(index, request_id, result, page_size)
+
+def search(index, retrieval, embedding):
+    if retrieval == "faces":
+        return index.photos.search(embedding, PHOTO_MIN_SIMILARITY)
+    return index.matcher.matches(embedding, MATCH_TOP_K, MATCH_MIN_SIMILARITY)
+
+def search_many(index, retrieval, embeddings):
+    if retrieval == "faces":
+        return index.photos.search_many(embeddings, PHOTO_MIN_SIMILARITY)
+    return index.matcher.matches_many(embeddings, MATCH_TOP_K, MATCH_MIN_SIMILARITY)
+
+async def infer_and_match(index, timer, request_id, contents, cache_key, page_size, mode, retrieval="clusters"):
+    # Decode and detect/align the face(s) in the inference pool; decode
+    # and detect are timed inside the pool, the rest is queueing
+    try:
+        if mode == "group":
+            (face_crops, bboxes, _), stage_times = await inference_pool.run(
+                pipeline.timed, pipeline.detect_faces, contents, DECODE_LIMITS, MAX_GROUP_FACES
+            )
+        else:
+            face_crop, stage_times = await inference_pool.run(
+                pipeline.timed, pipeline.detect_and_align, contents, DECODE_LIMITS
+            )
+        timer.split(stage_times, "pool_wait")
+    except ImageTooLarge as e:
+        return error_response(413, "too_large", str(e), request_id)
+    except UnreadableImage as e:
+        return error_response(400, "unreadable", str(e), request_id)
+    except NoFaceDetected as e:
+        FACES_PER_QUERY.observe(0)
+        return error_response(400, "no_face", str(e), request_id)
+
+    if mode == "group":
+        # All faces go through recognition in one batched call and are
+        # scored against every cluster in one matrix product
+        FACES_PER_QUERY.observe(len(face_crops))
+        embeddings = await inference_pool.run(pipeline.embed_crops, face_crops)
+        timer.lap("recognize")
+        face_matches = await inference_pool.run_local(search_many, index, retrieval, embeddings)
+        timer.lap("score")
+        result_key = "photos" if retrieval == "faces" else "matches"
+        faces = [
+            {"bbox": bbox[:4].tolist(), "det_score": float(bbox[4]), result_key: matches}
+            for bbox, matches in zip(bboxes, face_matches)
+        ]
+        result_cache.put(cache_key, (embeddings, faces))
+        response = render_result(index, request_id, faces, page_size, mode, retrieval)
+        timer.lap("urls")
+        return response
+
+    # Extract embedding, batched with other in-flight requests
+    FACES_PER_QUERY.observe(1)
+    uploaded_embedding = await embed_batcher.submit(face_crop)
+    timer.lap("recognize")
+
+    # Match with cluster embeddings (one matrix product over all clusters),
+    # or with every stored face for retrieval=faces
+    matches = await inference_pool.run_local(search, index, retrieval, uploaded_embedding)
+    timer.lap("score")
+    result_cache.put(cache_key, (uploaded_embedding, matches))
+
+    # Drive URLs for each person were resolved and serialised at load time
+    response = render_result(index, request_id, matches, page_size, mode, retrieval)
+    timer.lap("urls")
+    return response
+
+# ---------- Bulk Match (kiosks, offline jobs) ----------
+# At most BULK_CONCURRENCY bulk images are in flight at once, across all
+# bulk requests, so a kiosk batch of hundreds cannot flood the pool. Each
+# one also goes through the admission gate, capped at half its slots, so
+# interactive matches always keep the other half; images turned away by
+# the gate get an "overloaded" record with retry_after.
+BULK_CONCURRENCY = min(int(os.environ.get("BULK_CONCURRENCY", 4)), max(1, admission.limit // 2))
+bulk_slots = asyncio.Semaphore(BULK_CONCURRENCY)
+
+async def match_one(event_index, i, filename, contents):
+    # Same decode -> detect -> batched embed -> match path as a single request
+    async with bulk_slots:
+        try:
+            async with admission.admit():
+                face_crop = await inference_pool.run(pipeline.detect_and_align, contents, DECODE_LIMITS)
+                embedding = await embed_batcher.submit(face_crop)
+                matches = await inference_pool.run_local(search, event_index, "clusters", embedding)
+            return match_record(i, filename, matches, event_index.urls([pid for pid, _ in matches]))
+        except Overloaded as e:
+            ERRORS.inc(e.reason)
+            record = match_record(i, filename, error=str(e))
+            record["retry_after"] = e.retry_after
+            return record
+        except Exception as e:
+            return match_record(i, filename, error=str(e))
+
+@app.post("/api/v1/bulk-match")
+async def bulk_match(images: List[UploadFile] = File(...), event_id: str = Form(None)):
+    # Results are streamed as NDJSON in completion order; "index" is the
+    # position of the image in the upload. Uploads are read up front because
+    # the form files are closed once this handler returns.
+    try:
+        index = (await event_registry.get(event_id)).current
+    except UnknownEvent as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    uploads = [(image.filename, await image.read()) for image in images]
+
+    async def results():
+        tasks = [asyncio.create_task(match_one(index, i, filename, contents))
+                 for i, (filename, contents) in enumerate(uploads)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield (json.dumps(await task) + "\n").encode()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+# ---------- Later Pages of a Match ----------
+# face_id may be several comma-separated ids (a multi-cluster match). Face ids
+# are DBSCAN labels and get renumbered when the event is re-clustered, so a
+# cursor (or the version query parameter, for a first page) from an older
+# index gets a 410 instead of another person's photos.
+@app.get("/api/v1/similar-photos/{face_id}")
+async def get_photo_page(
+    face_id: str,
+    cursor: str = Query(None),
+    limit: int = Query(12, ge=1, le=MAX_PAGE_SIZE),
+    request_id: str = Query(None),
+    event_id: str = Query(None),
+    version: str = Query(None)
+):
+    # No face matching here: the face_id comes from an earlier match response
+    face_ids = face_id.split(",")
+    offset = 0
+    if cursor:
+        try:
+            version, cursor_face_ids, offset = decode_cursor(cursor)
+        except ValueError as e:
             return JSONResponse(status_code=400, content={
-                "error": "Could not read image or unsupported format.",
+                "error": str(e),
                 "request_id": request_id
             })
-
-        # Detect face and extract embedding
-        faces = face_app.get(img)
-        if not faces:
+        if cursor_face_ids != face_ids:
             return JSONResponse(status_code=400, content={
-                "error": "No face detected in the image.",
+                "error": f"Cursor does not belong to face_id '{face_id}'.",
                 "request_id": request_id
             })
 
-        uploaded_embedding = faces[0].embedding
-
-        # Match with cluster embeddings
-        similarities = {
-            str(pid): cosine_similarity([uploaded_embedding], [emb])[0][0]
-            for pid, emb in cluster_embeddings.items()
-        }
-
-        best_match_id = max(similarities, key=similarities.get)
-        matched_files = person_to_photos.get(best_match_id, [])
-
-        # Map to Drive URLs
-        image_urls_4k = []
-        for path in matched_files:
-            fname = os.path.basename(path)
-            drive_url = get_drive_url(fname)
-            if drive_url:
-                image_urls_4k.append(drive_url)
-
-        return {
-            "request_id": request_id,
-            "face_id": best_match_id,
-            "imagePaths": image_urls_4k
-        }
+    try:
+        index = (await event_registry.get(event_id)).current
+    except UnknownEvent as e:
+        return JSONResponse(status_code=404, content={
+            "error": str(e),
+            "request_id": request_id
+        })
+    if version is not None and version != index.version:
+        return JSONResponse(status_code=410, content={
+            "error": "The event's photos were re-indexed since this result; search again.",
+            "request_id": request_id
+        })
+    unknown = [pid for pid in face_ids if not index.has_person(pid)]
+    if unknown:
+        return JSONResponse(status_code=404, content={
+            "error": f"Unknown face_id '{','.join(unknown)}'.",
+            "request_id": request_id
+        })
 
+    return Response(
+        content=index.render_page(request_id, face_ids, offset, limit),
+        media_type="application/json",
+    )
+
+# ---------- Metrics ----------
+def collect_component_stats():
+    events = event_registry.stats()
+    for event_id, stats in events["events"].items():
+        INDEX_CLUSTERS.set(event_id, value=stats["clusters"])
+        INDEX_GENERATION.set(event_id, value=stats["generation"])
+    EVENTS_LOADED.set(value=events["events_loaded"])
+    EVENTS_BYTES.set(value=events["bytes_used"])
+    EVENT_LOADS.set(value=events["loads"])
+    EVENT_EVICTIONS.set(value=events["evictions"])
+    POOL_PENDING.set(value=inference_pool.pending)
+    ADMISSION_ACTIVE.set(value=admission.active)
+    ADMISSION_WAITING.set(value=admission.waiting)
+    BATCH_QUEUE.set(value=embed_batcher.queue_depth())
+    BATCHES.set(value=embed_batcher.batches)
+    BATCHED_ITEMS.set(value=embed_batcher.items)
+    cache = result_cache.stats()
+    CACHE_LOOKUPS.set("hit", value=cache["hits"])
+    CACHE_LOOKUPS.set("miss", value=cache["misses"])
+    CACHE_ENTRIES.set(value=cache["entries"])
+    CACHE_BYTES.set(value=cache["bytes"])
+
+metrics_registry.collectors.append(collect_component_stats)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+# ---------- Batching Metrics ----------
+@app.get("/api/v1/batching-stats")
+async def batching_stats():
+    return embed_batcher.stats()
+
+@app.get("/api/v1/cache-stats")
+async def cache_stats():
+    return result_cache.stats()
+
+@app.get("/api/v1/admission-stats")
+async def admission_stats():
+    return admission.stats()
+
+# ---------- Index Reload ----------
+# Run after cluster_faces.py has rewritten the index files, e.g.
+#   curl -X POST -H "X-Admin-Token: $ADMIN_TOKEN" localhost:8000/api/v1/admin/reload-index
+# Only reloads the worker that receives it; under serve.py use
+# INDEX_WATCH_INTERVAL instead so every worker picks the change up.
+@app.post("/api/v1/admin/reload-index")
+async def reload_index(x_admin_token: str = Header(None), event_id: str = Query(None)):
+    # Events that are not loaded need no reload: they are read fresh on first use
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        return JSONResponse(status_code=403, content={"error": "Admin token required."})
+    reloader = event_registry.loaded(event_id)
+    if reloader is None:
+        return JSONResponse(status_code=404, content={"error": f"Event '{event_id}' is not loaded."})
+    try:
+        return await event_registry.reload(event_id)
     except Exception as e:
         return JSONResponse(status_code=500, content={
-            "error": str(e),
-            "request_id": request_id
+            "error": f"Reload failed, still serving generation {reloader.generation}: {e}"
         })
 
+@app.get("/api/v1/admin/index-stats")
+async def index_stats():
+    return event_registry.stats()
+
 # ---------- Launch ----------
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
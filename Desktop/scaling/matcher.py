@@ -0,0 +1,104 @@
+import pickle
+import numpy as np
+
+
+def normalize_rows(matrix):
+    # L2-normalise each row; zero rows stay zero (same as sklearn's cosine_similarity)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(sims, k):
+    # Indices of the k largest values, best first
+    n = sims.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-sims, k - 1)[:k] if k < n else np.arange(n)
+    return idx[np.argsort(-sims[idx], kind="stable")]
+
+
+class FaceMatcher:
+    """Cosine-similarity search over one embedding per person (cluster).
+
+    The representatives are stacked once into a contiguous, L2-normalised
+    float32 matrix, so scoring a query is a single matrix-vector product
+    instead of one cosine_similarity call per cluster.
+    """
+
+    def __init__(self, ids, embeddings):
+        self.ids = [str(pid) for pid in ids]
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        self.matrix = np.ascontiguousarray(normalize_rows(matrix))
+
+    @classmethod
+    def from_normalized(cls, ids, matrix):
+        # matrix is already float32, C-contiguous and L2-normalised (e.g. a
+        # memory-mapped bundle array); use it as-is so its pages stay shared
+        matcher = cls.__new__(cls)
+        matcher.ids = [str(pid) for pid in ids]
+        matcher.matrix = matrix
+        return matcher
+
+    @classmethod
+    def from_pickle(cls, path):
+        # cluster_representatives.pkl: {cluster_label: embedding}
+        with open(path, "rb") as f:
+            cluster_embeddings = pickle.load(f)
+        return cls(list(cluster_embeddings.keys()), list(cluster_embeddings.values()))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def scores(self, query):
+        # query: (dim,) or (n_queries, dim) -> cosine similarity per cluster
+        q = normalize_rows(np.asarray(query, dtype=np.float32))
+        return q @ self.matrix.T
+
+    def top_k(self, query, k=1):
+        """Return the k best (face_id, score) pairs for one query, best first."""
+        sims = self.scores(query)
+        return self._select(sims, k)
+
+    def best(self, query):
+        return self.top_k(query, 1)[0]
+
+    def matches(self, query, k=1, min_score=None):
+        """Top-k (face_id, score) pairs whose score is at least min_score.
+
+        With k=1 and no min_score this is the old single-best lookup; it can
+        return an empty list when a threshold is set and nothing qualifies.
+        """
+        results = self.top_k(query, k)
+        if min_score is not None:
+            results = [(pid, score) for pid, score in results if score >= min_score]
+        return results
+
+    def matches_many(self, queries, k=1, min_score=None):
+        """matches() for several queries, scored with one matrix product."""
+        sims = self.scores(np.atleast_2d(queries))
+        results = []
+        for row in sims:
+            row_matches = self._select(row, k)
+            if min_score is not None:
+                row_matches = [(pid, score) for pid, score in row_matches if score >= min_score]
+            results.append(row_matches)
+        return results
+
+    def _select(self, sims, k):
+        n = sims.shape[0]
+        k = min(k, n)
+        if k <= 0:
+            return []
+        if k < n:
+            # Partial selection: O(n) to find the k best, then sort only those
+            idx = np.argpartition(-sims, k - 1)[:k]
+        else:
+            idx = np.arange(n)
+        idx = idx[np.argsort(-sims[idx], kind="stable")]
+        return [(self.ids[i], float(sims[i])) for i in idx]
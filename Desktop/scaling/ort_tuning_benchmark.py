@@ -0,0 +1,139 @@
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import statistics
+import numpy as np
+import onnxruntime
+from insightface.utils import face_align
+from face_models import load_face_app, ORT_DEFAULTS, GRAPH_OPT_LEVELS, EXECUTION_MODES
+from image_decode import decode_downscaled
+
+# ---------- SETUP ----------
+# Sweeps ONNX Runtime settings (providers, threads, execution mode, graph
+# optimisation level) over the resolution variants and times what a match
+# request runs: detection + alignment + recognition at the API's working
+# resolution. The fastest combination is written as an ORT_CONFIG file.
+input_folder = os.path.join("..", "benchmark", "img_variants")
+output_csv = "ort_tuning_log.csv"
+output_config = "ort_config.best.json"
+
+
+def load_images(folder, max_side, limit):
+    images = []
+    for fname in sorted(os.listdir(folder)):
+        if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        with open(os.path.join(folder, fname), "rb") as f:
+            img, _, _ = decode_downscaled(f.read(), max_side)
+        if img is not None:
+            images.append((fname, img))
+        if limit and len(images) >= limit:
+            break
+    return images
+
+
+def time_config(config, images, repeats):
+    start = time.perf_counter()
+    face_app = load_face_app("embed", ort_config=config, verbose=False)
+    load_ms = (time.perf_counter() - start) * 1000.0
+
+    det_model = face_app.det_model
+    rec_model = face_app.models["recognition"]
+    image_size = rec_model.input_size[0]
+
+    def run(img):
+        _, kpss = det_model.detect(img, max_num=0, metric="default")
+        crops = [face_align.norm_crop(img, landmark=kps, image_size=image_size) for kps in kpss]
+        if crops:
+            rec_model.get_feat(crops)
+        return len(crops)
+
+    run(images[0][1])  # first run pays for arena allocation
+    per_image_ms = []
+    n_faces = 0
+    for _ in range(repeats):
+        for _, img in images:
+            t0 = time.perf_counter()
+            n_faces += run(img)
+            per_image_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    return {
+        "load_ms": round(load_ms, 1),
+        "mean_ms": round(statistics.mean(per_image_ms), 2),
+        "p95_ms": round(float(np.percentile(per_image_ms, 95)), 2),
+        "images_per_s": round(1000.0 / statistics.mean(per_image_ms), 2),
+        "faces": n_faces // repeats,
+    }
+
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    default_threads = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    available = onnxruntime.get_available_providers()
+
+    parser = argparse.ArgumentParser(description="Find the fastest ONNX Runtime settings for this host")
+    parser.add_argument("--input", default=input_folder, help="Folder of test images")
+    parser.add_argument("--limit", type=int, default=20, help="Images to use (0 = all)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-side", type=int, default=1280, help="Working resolution, as in the API")
+    parser.add_argument("--providers", nargs="+",
+                        default=[p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available],
+                        help="Execution providers to try, one at a time")
+    parser.add_argument("--threads", type=int, nargs="+", default=default_threads, help="Intra-op thread counts")
+    parser.add_argument("--inter-threads", type=int, nargs="+", default=[0], help="Inter-op thread counts (0 = default)")
+    parser.add_argument("--modes", nargs="+", default=list(EXECUTION_MODES), choices=EXECUTION_MODES)
+    parser.add_argument("--levels", nargs="+", default=["basic", "extended", "all"], choices=GRAPH_OPT_LEVELS)
+    args = parser.parse_args()
+
+    images = load_images(args.input, args.max_side, args.limit)
+    if not images:
+        raise SystemExit(f"❌ No images in {args.input}")
+
+    combos = list(itertools.product(args.providers, args.threads, args.inter_threads, args.modes, args.levels))
+    print(f"🚀 {len(combos)} ONNX Runtime configurations x {len(images)} images x {args.repeats} repeats")
+
+    results = []
+    for provider, threads, inter, mode, level in combos:
+        # Inter-op threads only matter in parallel mode
+        if mode == "sequential" and inter:
+            continue
+        config = dict(ORT_DEFAULTS, providers=[provider], intra_op_threads=threads,
+                      inter_op_threads=inter, execution_mode=mode, graph_optimization_level=level)
+        try:
+            timing = time_config(config, images, args.repeats)
+        except Exception as e:
+            print(f"   ⚠️ {provider} threads={threads} {mode} {level}: {e}")
+            continue
+        row = {"provider": provider, "intra_op_threads": threads, "inter_op_threads": inter,
+               "execution_mode": mode, "graph_optimization_level": level, **timing}
+        results.append(row)
+        print(f"   {provider:<24} threads={threads:<3} inter={inter:<3} {mode:<10} {level:<8} "
+              f"{timing['mean_ms']:>8.1f} ms/img  p95 {timing['p95_ms']:.1f}  load {timing['load_ms']:.0f} ms")
+
+    if not results:
+        raise SystemExit("❌ No configuration could be loaded")
+
+    # ---------- SAVE RESULTS ----------
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+    best = min(results, key=lambda r: r["mean_ms"])
+    best_config = {
+        "providers": [best["provider"]],
+        "intra_op_threads": best["intra_op_threads"],
+        "inter_op_threads": best["inter_op_threads"],
+        "execution_mode": best["execution_mode"],
+        "graph_optimization_level": best["graph_optimization_level"],
+    }
+    with open(output_config, "w") as f:
+        json.dump(best_config, f, indent=2)
+
+    print(f"\n🏆 Best: {best['mean_ms']} ms/img ({best['images_per_s']} img/s) with {best_config}")
+    print(f"   Use it with: ORT_CONFIG={output_config} uvicorn main:app")
+    print("   (serve.py keeps a configured thread count instead of cores // workers)")
+    print(f"\n✅ Done! 📁 Results saved to: {output_csv}")
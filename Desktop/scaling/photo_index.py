@@ -0,0 +1,174 @@
+# Face -> photo index for retrieval that bypasses clustering, written by
+# preprocess_faces.py (or by `python photo_index.py`).
+#
+# photo_index/
+#   meta.json            format version, counts, embedding dim
+#   face_photos.npy      int32   (n_faces,)   photo of each face
+#   photo_names.npy      bytes   (n_photos,)  UTF-8 filenames
+#   face_embeddings.npy  float32 (n_faces, dim), L2-normalised; left out when
+#                        embedding_store/ holds the same faces (EMBEDDING_CODEC)
+#
+# Rows are the bundle's face rows (see index_bundle.py). A query retrieves its
+# nearest stored faces and each photo scores as its best face; DBSCAN labels
+# and person_to_photos.json are not involved.
+import os
+import json
+import time
+import pickle
+import argparse
+import numpy as np
+from matcher import normalize_rows, top_k
+from index_bundle import write_array_dir
+
+PHOTO_INDEX_DIR = "photo_index"
+FORMAT_VERSION = 1
+
+
+def write_photo_index(path, face_data, with_embeddings=True):
+    """Write a photo index for one preprocessing run; replaces `path` atomically.
+
+    with_embeddings=False skips the float32 face matrix, for directories
+    whose faces are searched through embedding_store/ instead.
+    """
+    photo_names = sorted({entry["filename"] for entry in face_data})
+    photo_ids = {name: i for i, name in enumerate(photo_names)}
+    dim = int(np.asarray(face_data[0]["embedding"]).shape[-1]) if face_data else 0
+    arrays = {
+        "face_photos": np.array([photo_ids[entry["filename"]] for entry in face_data], dtype=np.int32),
+        "photo_names": np.array([n.encode() for n in photo_names], dtype=np.bytes_),
+    }
+    if with_embeddings:
+        arrays["face_embeddings"] = normalize_rows(
+            np.array([e["embedding"] for e in face_data], dtype=np.float32).reshape(len(face_data), dim)
+        )
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dim": dim,
+        "n_faces": len(face_data),
+        "n_photos": len(photo_names),
+        "arrays": sorted(arrays),
+    }
+    return write_array_dir(path, arrays, meta)
+
+
+def photo_index_exists(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+class PhotoIndex:
+    """Read-only, memory-mapped face -> photo arrays.
+
+    Opened from photo_index/, or from the same arrays in an index bundle
+    (from_bundle), which cluster_faces.py writes in the same face order.
+    """
+
+    def __init__(self, face_photos, photo_names, face_embeddings=None, dim=None):
+        self.face_photos = face_photos
+        self.photo_names = photo_names
+        self.face_embeddings = face_embeddings  # None when left out (see write_photo_index)
+        self._dim = dim if dim is not None else face_embeddings.shape[1]
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported photo index format {meta.get('format_version')!r}, "
+                             f"expected {FORMAT_VERSION}")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in meta["arrays"]}
+        return cls(arrays["face_photos"], arrays["photo_names"], arrays.get("face_embeddings"), meta["dim"])
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        return cls(bundle.face_photos, bundle.photo_names, bundle.face_embeddings)
+
+    def __len__(self):
+        return self.face_photos.shape[0]
+
+    @property
+    def dim(self):
+        return self._dim
+
+    def photo_name(self, photo_id):
+        return self.photo_names[photo_id].decode()
+
+
+class ExactFaceSearch:
+    """Brute-force cosine search with the ANN indexes' search interface."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    def search(self, query, k=10):
+        q = normalize_rows(np.asarray(query, dtype=np.float32).reshape(-1))
+        sims = self.embeddings @ q
+        best = top_k(sims, k)
+        return best, sims[best]
+
+    def search_many(self, queries, k=10):
+        return [self.search(q, k) for q in np.atleast_2d(queries)]
+
+
+class PhotoRetriever:
+    """Photos ranked by their best face's similarity to the query.
+
+    face_search is any face-level searcher over the same face rows (the ANN
+    index, the compressed store or ExactFaceSearch). It is asked for the
+    search_k nearest faces; while the last of those still clears
+    min_score, k grows (up to max_search_k) so a guest in hundreds of
+    photos gets all of them.
+    """
+
+    def __init__(self, photo_index, face_search, search_k=200, max_search_k=5000):
+        self.photo_index = photo_index
+        self.face_search = face_search
+        self.search_k = search_k
+        self.max_search_k = max_search_k
+
+    def __len__(self):
+        return len(self.photo_index)
+
+    def _faces_above(self, query, min_score):
+        k = self.search_k
+        while True:
+            rows, scores = self.face_search.search(query, k)
+            exhausted = len(rows) < k or k >= min(self.max_search_k, len(self.face_search))
+            if exhausted or scores[-1] < min_score:
+                keep = scores >= min_score
+                return rows[keep], scores[keep]
+            k = min(k * 4, self.max_search_k)
+
+    def search(self, query, min_score):
+        """[(photo_id, score), ...] best first; score = best face in the photo."""
+        rows, scores = self._faces_above(query, min_score)
+        photos = self.photo_index.face_photos[rows]
+        # Hits are sorted best first, so a photo's first hit is its best face
+        _, first = np.unique(photos, return_index=True)
+        first.sort()
+        return [(int(photos[i]), float(scores[i])) for i in first]
+
+    def search_many(self, queries, min_score):
+        return [self.search(q, min_score) for q in np.atleast_2d(queries)]
+
+
+# Build photo_index/ from processed_data.pkl
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the face -> photo index")
+    parser.add_argument("--source", default="processed_data.pkl")
+    parser.add_argument("--output", default=PHOTO_INDEX_DIR)
+    parser.add_argument("--no-embeddings", action="store_true",
+                        help="Leave out the float32 embeddings (faces searched through embedding_store/)")
+    args = parser.parse_args()
+
+    with open(args.source, "rb") as f:
+        face_data = pickle.load(f)
+    meta = write_photo_index(args.output, face_data, with_embeddings=not args.no_embeddings)
+    print(f"✅ Indexed {meta['n_faces']} faces in {meta['n_photos']} photos -> '{args.output}/'")
@@ -0,0 +1,160 @@
+# Model-side stages of a match request (decode -> detect -> embed).
+# These run inside the inference pool, so they only use per-process state
+# and take/return picklable values; that keeps them usable from both the
+# thread pool and the process pool.
+import logging
+import os
+import threading
+import time
+import numpy as np
+from insightface.utils import face_align
+from face_models import load_face_app
+from image_decode import decode_downscaled, measure_decode_rate
+
+logger = logging.getLogger("pipeline")
+
+
+class UnreadableImage(ValueError):
+    pass
+
+
+class NoFaceDetected(ValueError):
+    pass
+
+
+_face_app = None
+_decode_ms_per_mp = None  # full-size JPEG decode cost, for the "saved" estimate
+_init_lock = threading.Lock()
+_stage_times = threading.local()
+
+
+def _record_stage(stage, seconds):
+    times = getattr(_stage_times, "current", None)
+    if times is not None:
+        times[stage] = times.get(stage, 0.0) + seconds
+
+
+def timed(fn, *args):
+    """Run fn(*args) -> (result, {stage: seconds}) for the stages it went through.
+
+    The timings come back with the result, so this works from the process
+    pool as well; the API feeds them into its /metrics histograms.
+    """
+    _stage_times.current = {}
+    try:
+        return fn(*args), _stage_times.current
+    finally:
+        _stage_times.current = None
+
+
+def init_worker():
+    # Called once per process: by the first job in the API process for the
+    # thread pool, or as the initializer of every process-pool worker.
+    global _face_app, _decode_ms_per_mp
+    with _init_lock:
+        if _face_app is None:
+            logging.basicConfig(level=logging.INFO)
+            # detection + recognition only
+            _face_app = load_face_app("embed")  # ONNX Runtime settings from ORT_* / ORT_CONFIG
+            _decode_ms_per_mp = measure_decode_rate()
+    return _face_app
+
+
+def get_face_app():
+    return init_worker()
+
+
+def decode_upload(contents, limits):
+    """Decode an upload at the working resolution -> (img, scale).
+
+    limits: dict with max_bytes, max_pixels and max_side (long side of the
+    working image; 0/None keeps the original size).
+    """
+    start = time.perf_counter()
+    img, scale, reduction = decode_downscaled(
+        contents,
+        limits.get("max_side"),
+        max_bytes=limits.get("max_bytes"),
+        max_pixels=limits.get("max_pixels"),
+    )
+    decode_ms = (time.perf_counter() - start) * 1000.0
+    _record_stage("decode", decode_ms / 1000.0)
+    if img is None:
+        raise UnreadableImage("Could not read image or unsupported format.")
+
+    if scale < 1.0:
+        h, w = img.shape[:2]
+        orig_mp = (w / scale) * (h / scale) / 1e6
+        saved_ms = (_decode_ms_per_mp or 0.0) * orig_mp - decode_ms
+        logger.info("🖼️ Downscaled %dx%d -> %dx%d (1/%d JPEG decode) in %.1f ms, ~%.1f ms saved",
+                    round(w / scale), round(h / scale), w, h, reduction, decode_ms, saved_ms)
+    return img, scale
+
+
+def detect_faces(contents, limits, max_faces=0):
+    """Decode an upload, detect faces and align them for recognition.
+
+    Returns (crops, bboxes, kpss) for at most max_faces faces (0 = all), in
+    detector order, with bboxes/keypoints mapped back to original-image
+    coordinates. This is the same detection + norm_crop that FaceAnalysis.get
+    does before recognition; the recognition step itself is left to
+    embed_crops so that crops from concurrent requests can be embedded together.
+    """
+    img, scale = decode_upload(contents, limits)
+
+    face_app = get_face_app()
+    start = time.perf_counter()
+    bboxes, kpss = face_app.det_model.detect(img, max_num=0, metric="default")
+    _record_stage("detect", time.perf_counter() - start)
+    if bboxes.shape[0] == 0:
+        raise NoFaceDetected("No face detected in the image.")
+    if max_faces:
+        bboxes, kpss = bboxes[:max_faces], kpss[:max_faces]
+
+    image_size = face_app.models["recognition"].input_size[0]
+    start = time.perf_counter()
+    crops = [face_align.norm_crop(img, landmark=kps, image_size=image_size) for kps in kpss]
+    _record_stage("detect", time.perf_counter() - start)  # alignment counts as detection
+
+    bboxes = bboxes.copy()
+    bboxes[:, :4] /= scale
+    return crops, bboxes, kpss / scale
+
+
+def detect_and_align(contents, limits):
+    """Aligned crop of the first detected face in an upload."""
+    crops, _, _ = detect_faces(contents, limits, max_faces=1)
+    return crops[0]
+
+
+def embed_crops(crops):
+    """Run the recognition model once over a batch of aligned crops -> (n, 512)."""
+    rec_model = get_face_app().models["recognition"]
+    return rec_model.get_feat(crops)
+
+
+def warmup(max_side=1280, batch_sizes=(1,)):
+    """Push synthetic inputs through detection and recognition.
+
+    The first real session.run pays for ONNX Runtime initialisation and
+    memory-arena growth; doing it here at startup keeps that off the first
+    guest's request. Returns the time taken in ms.
+    """
+    start = time.perf_counter()
+    face_app = get_face_app()
+    rng = np.random.default_rng(0)
+
+    # Landscape and portrait uploads at the working resolution
+    long_side = max_side or 640
+    for w, h in ((long_side, long_side * 3 // 4), (long_side * 3 // 4, long_side)):
+        img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        face_app.det_model.detect(img, max_num=0, metric="default")
+
+    # Recognition at every batch size the batcher will send
+    size = face_app.models["recognition"].input_size[0]
+    for n in batch_sizes:
+        embed_crops([rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(n)])
+
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    logger.info("🔥 Warmed up models in %.0f ms (pid %d)", elapsed_ms, os.getpid())
+    return elapsed_ms
@@ -111,15 +111,19 @@ import cv2
 import pickle
 import numpy as np
 from tqdm import tqdm
-from insightface.app import FaceAnalysis
+from face_models import load_face_app
+from embedding_store import build_store, save_store, STORE_DIR
+from photo_index import write_photo_index, PHOTO_INDEX_DIR
 
 # Configuration
 IMAGE_DIR = "downloaded_images"
 OUTPUT_FILE = "processed_data.pkl"
+# Also write a compact copy of the embeddings to embedding_store/ for the API
+# ("pq", "int8" or "float16"; empty = don't)
+EMBEDDING_CODEC = os.environ.get("EMBEDDING_CODEC", "")
 
-# Initialize InsightFace
-app = FaceAnalysis(name="buffalo_l")
-app.prepare(ctx_id=0)  # Use -1 for CPU-only
+# Initialize InsightFace (only bbox + embedding are stored, so skip the other modules)
+app = load_face_app("embed")
 
 # Helper function to extract all faces from all images in subfolders
 def preprocess_images(image_dir):
@@ -164,3 +168,14 @@ if __name__ == "__main__":
 
     print(f"✅ Done! Processed {len(data)} faces from {IMAGE_DIR}.")
     print(f"📁 Saved to {OUTPUT_FILE}")
+
+    # Face -> photo index for retrieval without clusters (retrieval=faces);
+    # with a codec the store below replaces its float32 embeddings
+    meta = write_photo_index(PHOTO_INDEX_DIR, data, with_embeddings=not EMBEDDING_CODEC)
+    print(f"📁 Indexed {meta['n_faces']} faces in {meta['n_photos']} photos to '{PHOTO_INDEX_DIR}/'")
+
+    if EMBEDDING_CODEC and data:
+        print(f"📦 Encoding embeddings as {EMBEDDING_CODEC}...")
+        store = build_store(np.array([entry["embedding"] for entry in data], dtype=np.float32), EMBEDDING_CODEC)
+        meta = save_store(store, STORE_DIR)
+        print(f"📁 Saved {meta['n_faces']} faces ({meta['bytes_per_face']} B/face) to '{STORE_DIR}/'")
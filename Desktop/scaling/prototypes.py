@@ -0,0 +1,106 @@
+import numpy as np
+from matcher import normalize_rows
+from ann_index import spherical_kmeans
+
+
+def cluster_prototypes(embeddings, labels, rep_labels, n_prototypes=4, seed=0):
+    """Normalised centroid plus up to n_prototypes medoids per cluster.
+
+    Returns (centroids, proto_indptr, prototypes), rows in rep_labels order;
+    the prototypes of cluster row r are prototypes[proto_indptr[r]:proto_indptr[r + 1]].
+    Clusters with at most n_prototypes faces keep all of them. Larger ones
+    are split into n_prototypes groups by spherical k-means, and each group
+    contributes its medoid: the face with the highest summed cosine
+    similarity to the rest of the group, i.e. argmax x . sum(group).
+    """
+    x = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    labels = np.asarray(labels)
+    rep_labels = np.asarray(rep_labels)
+
+    # Group face rows by cluster row (rep_labels order) in one sort
+    order = np.argsort(rep_labels)
+    face_rows = order[np.searchsorted(rep_labels[order], labels)]
+    by_cluster = np.argsort(face_rows, kind="stable")
+    counts = np.bincount(face_rows, minlength=len(rep_labels))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    sums = np.add.reduceat(x[by_cluster], starts, axis=0) if len(x) else np.zeros((0, x.shape[1]), np.float32)
+    centroids = normalize_rows(sums).astype(np.float32)
+
+    protos = []
+    for row, (start, count) in enumerate(zip(starts, counts)):
+        members = x[by_cluster[start:start + count]]
+        if count <= n_prototypes:
+            protos.append(members)
+            continue
+        centres = spherical_kmeans(members, n_prototypes, n_iter=10, seed=seed)
+        groups = np.argmax(members @ centres.T, axis=1)
+        medoids = []
+        for g in np.unique(groups):
+            group = members[groups == g]
+            medoids.append(group[np.argmax(group @ group.sum(axis=0))])
+        protos.append(np.stack(medoids))
+
+    proto_indptr = np.zeros(len(rep_labels) + 1, dtype=np.int64)
+    proto_indptr[1:] = np.cumsum([len(p) for p in protos])
+    prototypes = np.concatenate(protos).astype(np.float32) if protos else np.zeros((0, x.shape[1]), np.float32)
+    return centroids, proto_indptr, np.ascontiguousarray(prototypes)
+
+
+class PrototypeMatcher:
+    """FaceMatcher-compatible two-stage search over cluster prototypes.
+
+    Stage 1 scores the query against every cluster centroid and keeps the
+    coarse_k best clusters; stage 2 re-ranks those by their best prototype.
+    The cost per query is fixed: one centroid scan plus coarse_k x
+    (prototypes per cluster) dot products, however many faces a person has.
+    """
+
+    def __init__(self, ids, centroids, proto_indptr, prototypes, coarse_k=32):
+        self.ids = [str(pid) for pid in ids]
+        self.centroids = centroids
+        self.proto_indptr = proto_indptr
+        self.prototypes = prototypes
+        self.coarse_k = coarse_k
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    def _rerank(self, q, centroid_sims, k, min_score):
+        n = centroid_sims.shape[0]
+        c = min(max(self.coarse_k, k), n)
+        if c <= 0:
+            return []
+        shortlist = np.argpartition(-centroid_sims, c - 1)[:c] if c < n else np.arange(n)
+
+        # Prototype rows of the shortlisted clusters, as one gather
+        starts = self.proto_indptr[shortlist]
+        counts = self.proto_indptr[shortlist + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        rows = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+        best = np.maximum.reduceat(self.prototypes[rows] @ q, offsets)
+
+        top = np.argsort(-best, kind="stable")[:k]
+        results = [(self.ids[shortlist[i]], float(best[i])) for i in top]
+        if min_score is not None:
+            results = [(pid, score) for pid, score in results if score >= min_score]
+        return results
+
+    def top_k(self, query, k=1):
+        return self.matches(query, k)
+
+    def best(self, query):
+        return self.top_k(query, 1)[0]
+
+    def matches(self, query, k=1, min_score=None):
+        q = normalize_rows(np.asarray(query, dtype=np.float32).reshape(-1))
+        return self._rerank(q, self.centroids @ q, k, min_score)
+
+    def matches_many(self, queries, k=1, min_score=None):
+        q = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        sims = q @ self.centroids.T
+        return [self._rerank(qi, row, k, min_score) for qi, row in zip(q, sims)]
@@ -0,0 +1,105 @@
+import hashlib
+import sys
+import time
+from collections import OrderedDict
+
+
+def upload_key(contents, variant=""):
+    # Identical uploads (re-clicks, front-end retries) hash to the same key;
+    # variant keeps results of different query modes apart. It is hashed
+    # length-prefixed ahead of the bytes (blake2b's person= caps at 16 bytes,
+    # too short for event ids)
+    variant = variant.encode()
+    h = hashlib.blake2b(len(variant).to_bytes(4, "little") + variant, digest_size=16)
+    h.update(contents)
+    return h.digest()
+
+
+def result_variant(mode, retrieval, event_id, generation):
+    # Everything besides the upload that a cached /match result depends on
+    return f"{mode}:{retrieval}:{event_id or ''}:{generation}"
+
+
+class ResultCache:
+    """LRU cache with a TTL and a memory budget, keyed by upload hash.
+
+    Only touched from the event loop, so no locking is needed. Entry sizes
+    are estimated from their numpy arrays and strings; the least recently
+    used entries are evicted once max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=600, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.bytes_used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, size, value = entry
+        if self.ttl and time.monotonic() > expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        size = len(key) + _estimate_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes_used += size
+
+        while len(self._entries) > self.max_entries or (self.max_bytes and self.bytes_used > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes_used = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes_used -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes_used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+        }
+
+
+def _estimate_size(value):
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
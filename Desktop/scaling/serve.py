@@ -0,0 +1,153 @@
+# Production launcher: pre-fork N uvicorn workers that share one index.
+#
+#   python serve.py --workers 4
+#
+# The parent imports main.py, which loads the match index (the memory-mapped
+# index_bundle/ or the pickle/JSON files), opens the listening socket and
+# then forks the workers. The index pages are shared copy-on-write (and, for
+# the bundle, through the page cache) instead of being loaded once per
+# worker as with `uvicorn --workers`, which spawns fresh interpreters.
+# An index reloaded later (INDEX_WATCH_INTERVAL) is private to each worker;
+# a rolling restart of serve.py shares it again. Events from EVENTS_ROOT are
+# loaded lazily by each worker; their bundles are still shared through the
+# page cache.
+#
+# The model is normally loaded by each worker after the fork, because an
+# ONNX Runtime session owns thread pools that do not survive fork(). With
+# --preload-model the sessions are created in the parent instead. That is
+# only safe with single-threaded sessions, so it forces
+# ORT_INTRA_OP_THREADS=1 / ORT_INTER_OP_THREADS=1.
+#
+# Threads: each worker gets ORT_INTRA_OP_THREADS = cores // workers (unless
+# set there or in ORT_CONFIG, see face_models.py) and INFERENCE_WORKERS = 2
+# (unless set, so decode overlaps inference). That keeps workers x intra-op
+# threads at about the core count.
+#
+# Measuring throughput vs. workers
+# --------------------------------
+# worker_scaling_benchmark.py starts this launcher with 1, 2, 4, ... workers
+# in turn, waits for /ready, sends a fixed number of concurrent selfie
+# requests and writes requests/s and latency per worker count to
+# worker_scaling_log.csv:
+#
+#   python worker_scaling_benchmark.py --image ../benchmark/images/parth_face.png \
+#       --workers 1 2 4 8 --concurrency 16 --requests 200
+#
+# Throughput should rise roughly linearly until workers x intra-op threads
+# saturate the cores, then flatten. Past that point, more workers only add
+# memory and latency. Pick the smallest worker count on the plateau.
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+
+
+def _default_threads(workers):
+    cores = os.cpu_count() or 1
+    return max(1, cores // workers)
+
+
+def _run_worker(sock, app, log_level):
+    import uvicorn
+
+    # Respawned workers would otherwise inherit the supervisor's handlers;
+    # uvicorn installs its own once the server starts
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork multi-worker launcher for the match API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--preload-model", action="store_true",
+                        help="Load the model in the parent (forces single-threaded ONNX sessions)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Thread budget must be in the environment before main.py is imported.
+    # A thread count from ORT_CONFIG or ORT_INTRA_OP_THREADS is kept.
+    from face_models import ort_config_from_env
+    intra_threads = ort_config_from_env()["intra_op_threads"]
+    if args.preload_model:
+        intra_threads = 1
+        os.environ["ORT_INTER_OP_THREADS"] = "1"
+    elif not intra_threads:
+        intra_threads = _default_threads(args.workers)
+    os.environ["ORT_INTRA_OP_THREADS"] = str(intra_threads)
+    os.environ.setdefault("INFERENCE_WORKERS", "2")
+    os.environ.setdefault("OMP_NUM_THREADS", str(intra_threads))
+
+    start = time.time()
+    import main as api  # loads the index once, in the parent
+
+    if api.INFERENCE_POOL != "thread":
+        # The workers already are processes; a process pool created in the
+        # parent would also share its queues across the forked workers
+        sys.exit("❌ serve.py needs INFERENCE_POOL=thread")
+
+    if args.preload_model:
+        import pipeline
+        pipeline.init_worker()
+    print(f"📦 Parent loaded shared state in {time.time() - start:.2f} s "
+          f"(ORT_INTRA_OP_THREADS={os.environ['ORT_INTRA_OP_THREADS']})")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = {}
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(sock, api.app, args.log_level)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    for slot in range(args.workers):
+        spawn(slot)
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Supervise: replace workers that die unexpectedly
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"⚠️ Worker {pid} exited ({status}); restarting")
+            spawn(slot)
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from result_cache import ResultCache, upload_key, result_variant
+
+
+def test_upload_key_realistic_variants():
+    contents = b"\xff\xd8 selfie bytes"
+    single = upload_key(contents, result_variant("single", "clusters", None, 0))
+    group = upload_key(contents, result_variant("group", "faces", "wedding-2026-smith", 3))
+    long_event = upload_key(contents, result_variant("single", "faces", "e" * 128, 12345))
+
+    assert {len(single), len(group), len(long_event)} == {16}
+    assert len({single, group, long_event}) == 3
+    assert group == upload_key(contents, result_variant("group", "faces", "wedding-2026-smith", 3))
+
+
+def test_upload_key_separates_generations_and_uploads():
+    variant = result_variant("single", "clusters", "wedding-2026-smith", 3)
+    assert upload_key(b"a", variant) != upload_key(b"b", variant)
+    assert upload_key(b"a", variant) != upload_key(b"a", result_variant("single", "clusters", "wedding-2026-smith", 4))
+    # The variant is length-prefixed, so bytes can't move across the boundary
+    assert upload_key(b":0abc", "single:clusters::") != upload_key(b"abc", "single:clusters::0:")
+
+
+def test_cache_round_trip_with_realistic_key():
+    cache = ResultCache(max_entries=4)
+    key = upload_key(b"selfie", result_variant("group", "faces", "wedding-2026-smith", 3))
+    cache.put(key, ("result",))
+    assert cache.get(key) == ("result",)
@@ -0,0 +1,88 @@
+import os
+import sys
+import csv
+import time
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+from load_test import ENDPOINT, run_concurrency, summarize
+
+# ---------- SETUP ----------
+# Starts serve.py once per worker count, waits for /ready, then sends a fixed
+# number of concurrent selfie requests and logs throughput + latency.
+output_csv = "worker_scaling_log.csv"
+
+
+def wait_ready(base_url, timeout=300, streak=5):
+    # With several workers each /ready hit lands on a random one; require a
+    # streak of successes so most of them are warm
+    deadline = time.time() + timeout
+    ok = 0
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=2) as r:
+                ok = ok + 1 if r.status == 200 else 0
+        except (urllib.error.URLError, ConnectionError, OSError):
+            ok = 0
+        if ok >= streak:
+            return True
+        time.sleep(0.5)
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs. number of serve.py workers")
+    parser.add_argument("--image", required=True, help="Selfie to send")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        images = [(os.path.basename(args.image), f.read())]
+    base_url = f"http://127.0.0.1:{args.port}"
+    url = base_url + ENDPOINT
+    # Measure inference, not the repeat-upload cache
+    env = dict(os.environ, RESULT_CACHE_ENTRIES="0")
+
+    rows = []
+    for n_workers in args.workers:
+        print(f"🚀 {n_workers} worker(s)...")
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(n_workers), "--port", str(args.port),
+             "--host", "127.0.0.1", "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            if not wait_ready(base_url):
+                print(f"❌ Server with {n_workers} workers never became ready")
+                continue
+            run_concurrency(url, images, args.concurrency, n_requests=args.concurrency)  # warm connections
+            results, duration = run_concurrency(url, images, args.concurrency, n_requests=args.requests)
+        finally:
+            server.terminate()
+            server.wait()
+
+        summary = summarize(results, duration)
+        rows.append({
+            "workers": n_workers,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "errors": summary["errors"],
+            "throughput_rps": summary["throughput_rps"],
+            "p50_ms": summary["latency_ms"]["p50"],
+            "p95_ms": summary["latency_ms"]["p95"],
+            "p99_ms": summary["latency_ms"]["p99"],
+        })
+        print(f"   {rows[-1]}")
+
+    # ---------- SAVE RESULTS ----------
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["workers", "concurrency", "requests", "errors",
+                                               "throughput_rps", "p50_ms", "p95_ms", "p99_ms"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n✅ Done! 📁 Results saved to: {output_csv}")